@@ -0,0 +1,144 @@
+# BinaryProtocol.py
+# Author: Kristen Friday
+# Date: October 18, 2026
+
+# Compact binary wire protocol spoken by HashTableServer and HashTableClient
+# as an alternative to length-prefixed JSON.
+#
+# A client asks for it by sending HELLO as the first bytes on a new
+# connection; a server that supports it answers with the same HELLO, while
+# an older server rejects the non-numeric length prefix before the comma
+# with a JSON "Invalid Request" and the client keeps using JSON. Every message afterwards is a fixed header
+#   opcode or status (u8), flags (u8), reserved (u16), request id (u32),
+#   key length (u32), value length (u32)
+# followed by the key and the value. Keys are utf-8 and values are opaque
+# bytes holding the JSON encoding of the stored object; the server checks
+# that an inserted value is valid JSON and then keeps it encoded. Methods without an
+# opcode of their own travel as a JSON request in the value of OP_JSON.
+
+import json
+import struct
+
+
+VERSION = 1
+HELLO = b'\x00HTB' + bytes([VERSION]) + b','
+HEADER = struct.Struct('!BBHIII')
+
+OP_INSERT = 1
+OP_LOOKUP = 2
+OP_REMOVE = 3
+OP_SCAN = 4
+OP_JSON = 15
+
+OPCODES = {
+    "insert": OP_INSERT,
+    "lookup": OP_LOOKUP,
+    "remove": OP_REMOVE,
+    "scan": OP_SCAN
+}
+METHODS = {opcode: method for method, opcode in OPCODES.items()}
+
+# response statuses, indexed by their code
+STATUSES = ["Success", "Invalid Request", "Failure"]
+
+
+def pack(code, req_id, key, value):
+    '''Return a message with a header for the given key and value bytes'''
+
+    return HEADER.pack(code, 0, 0, req_id, len(key), len(value)) + key + value
+
+
+def frames(buf):
+    '''Yield (code, request id, key, value) for every complete message in a
+    bytearray, removing each one from the buffer'''
+
+    size = HEADER.size
+    while len(buf) >= size:
+        code, _, _, req_id, key_len, value_len = HEADER.unpack_from(buf)
+        end = size + key_len + value_len
+        if (len(buf) < end):
+            return
+
+        key = bytes(buf[size:size + key_len])
+        value = bytes(buf[size + key_len:end])
+        del buf[:end]
+
+        yield code, req_id, key, value
+
+
+def encode_request(message, req_id):
+    '''Encode a request dictionary; requests with other fields, or whose key
+    is not a string, are sent as JSON so the server sees them as they are'''
+
+    method = message.get("method")
+    field = "regex" if method == "scan" else "key"
+    key = message.get(field)
+
+    if (method not in OPCODES or type(key) != str or
+            not set(message) <= {"method", field, "value"}):
+        return pack(OP_JSON, req_id, b"", json.dumps(message).encode('utf-8'))
+
+    value = b""
+    if (method == "insert"):
+        value = json.dumps(message.get("value")).encode('utf-8')
+
+    return pack(OPCODES[method], req_id, key.encode('utf-8'), value)
+
+
+def decode_request(opcode, key, value):
+    '''Turn a binary request back into a request dictionary; raise
+    ValueError if it is malformed'''
+
+    try:
+        if (opcode == OP_JSON):
+            return json.loads(value)
+
+        method = METHODS[opcode]
+        key = key.decode('utf-8')
+    except (KeyError, UnicodeDecodeError):
+        raise ValueError(f'malformed binary request {opcode}')
+
+    if (method == "scan"):
+        return {"method": method, "regex": key}
+
+    req = {"method": method, "key": key}
+    if (method == "insert"):
+        # values are stored as sent, so they must be valid utf-8 JSON; the
+        # log holds one record per line, so a value with line breaks (only
+        # ever whitespace in JSON) is stored encoded again without them
+        decoded = json.loads(value.decode('utf-8'))
+        if (b"\n" in value or b"\r" in value):
+            value = json.dumps(decoded).encode('utf-8')
+        req["value"] = value
+
+    return req
+
+
+def encode_value(obj):
+    '''Return the JSON encoding of an object'''
+
+    return json.dumps(obj).encode('utf-8')
+
+
+def encode_response(res, req_id, encode=encode_value):
+    '''Encode a response dictionary, using encode for its result'''
+
+    if "error" in res:
+        code = STATUSES.index(res["status"]) if res["status"] in STATUSES else 2
+        value = str(res["error"]).encode('utf-8')
+    else:
+        code = 0
+        value = encode(res["result"])
+
+    return pack(code, req_id, b"", value)
+
+
+def decode_response(code, value):
+    '''Turn a binary response back into a response dictionary'''
+
+    status = STATUSES[code] if code < len(STATUSES) else "Failure"
+
+    if (code != 0):
+        return {"status": status, "error": value.decode('utf-8')}
+
+    return {"status": status, "result": json.loads(value)}
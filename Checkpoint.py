@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+# Checkpoint.py
+# Author: Kristen Friday
+# Date: October 18, 2026
+
+# Reads and writes the binary checkpoint format of the hash table server
+# and converts checkpoints written in the older JSON lines format.
+#
+# Layout (all integers little-endian):
+#  header:  magic "HTCK", version, flags, covered log segment,
+#           record count, offset of the key index (0 if none),
+#           crc32 of everything after the header
+#  records: key length (u32), value length (u32), utf-8 key, value
+#           (the value is the JSON encoding of the stored object); since
+#           version 2, the key is followed by the key's expiry time (f64,
+#           seconds since the epoch) if the value length has the EXPIRES
+#           bit set, then by its version (u64) if it has the VERSIONED bit
+#           set, before the value
+#  index:   record offsets (u64) sorted by key, if FLAG_INDEX is set
+#
+# Checkpoints without such records are still written as version 1.
+
+import sys
+import os
+import json
+import mmap
+import struct
+import zlib
+
+
+MAGIC = b'HTCK'
+VERSION = 2
+FLAG_INDEX = 1
+# set in the value length of a record that carries an expiry time or a
+# version
+EXPIRES = 1 << 31
+VERSIONED = 1 << 30
+
+HEADER = struct.Struct('<4sHHqQQI4x')
+RECORD = struct.Struct('<II')
+OFFSET = struct.Struct('<Q')
+DEADLINE = struct.Struct('<d')
+KEY_VERSION = struct.Struct('<Q')
+
+
+def write_checkpoint(path, items, segment, index=False, sync=True, expires=None,
+        versions=None):
+    '''Write (key, encoded value) pairs to path as a binary checkpoint that
+    covers every log segment up to and including segment; expires maps the
+    keys that expire to their expiry time, and versions the keys written
+    more than once to their version'''
+
+    count = 0
+    crc = 0
+    offsets = []
+    version = 1
+
+    with open(path, "wb") as fh:
+        # the header is rewritten once the count and checksum are known
+        fh.write(HEADER.pack(MAGIC, version, 0, segment, 0, 0, 0))
+        offset = HEADER.size
+
+        for key, value in items:
+            marks = 0
+            extra = b""
+            deadline = expires.get(key) if expires else None
+            if deadline is not None:
+                marks |= EXPIRES
+                extra += DEADLINE.pack(deadline)
+            number = versions.get(key) if versions else None
+            if number is not None:
+                marks |= VERSIONED
+                extra += KEY_VERSION.pack(number)
+            if marks:
+                version = VERSION
+
+            key = key.encode('utf-8')
+            record = RECORD.pack(len(key), len(value) | marks) + key + extra + value
+            fh.write(record)
+            crc = zlib.crc32(record, crc)
+
+            if index:
+                offsets.append((key, offset))
+            offset += len(record)
+            count += 1
+
+        flags = 0
+        index_offset = 0
+        if index:
+            flags |= FLAG_INDEX
+            index_offset = offset
+            offsets.sort()
+            for _, record_offset in offsets:
+                entry = OFFSET.pack(record_offset)
+                fh.write(entry)
+                crc = zlib.crc32(entry, crc)
+
+        fh.seek(0)
+        fh.write(HEADER.pack(MAGIC, version, flags, segment, count, index_offset, crc))
+
+        # flush and sync file to disk
+        fh.flush()
+        if sync:
+            os.fsync(fh.fileno())
+
+    return count
+
+
+def is_binary(path):
+    '''Return whether path holds a checkpoint in the binary format'''
+
+    with open(path, "rb") as fh:
+        return fh.read(len(MAGIC)) == MAGIC
+
+
+def map_checkpoint(path):
+    '''Memory-map a binary checkpoint and verify its header and checksum;
+    return the map and the unpacked header'''
+
+    with open(path, "rb") as fh:
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        if (len(mm) < HEADER.size):
+            raise ValueError(f'{path}: truncated checkpoint header')
+
+        header = HEADER.unpack_from(mm, 0)
+        magic, version = header[:2]
+        if (magic != MAGIC):
+            raise ValueError(f'{path}: not a binary checkpoint')
+        if (version > VERSION):
+            raise ValueError(f'{path}: unsupported checkpoint version {version}')
+
+        with memoryview(mm) as view:
+            crc = zlib.crc32(view[HEADER.size:])
+        if (crc != header[6]):
+            raise ValueError(f'{path}: checkpoint checksum mismatch')
+    except BaseException:
+        mm.close()
+        raise
+
+    return mm, header
+
+
+def iter_records(mm, count, expires=None, versions=None):
+    '''Yield (key, encoded value) pairs from a mapped checkpoint, then
+    release the map; the expiry times and versions of keys that have them
+    are added to the expires and versions dictionaries, if given, before
+    each key is yielded'''
+
+    unpack = RECORD.unpack_from
+    size = RECORD.size
+    offset = HEADER.size
+
+    try:
+        for _ in range(count):
+            key_len, value_len = unpack(mm, offset)
+            offset += size
+            key = mm[offset:offset + key_len].decode('utf-8')
+            offset += key_len
+            if (value_len & EXPIRES):
+                value_len ^= EXPIRES
+                if expires is not None:
+                    expires[key] = DEADLINE.unpack_from(mm, offset)[0]
+                offset += DEADLINE.size
+            if (value_len & VERSIONED):
+                value_len ^= VERSIONED
+                if versions is not None:
+                    versions[key] = KEY_VERSION.unpack_from(mm, offset)[0]
+                offset += KEY_VERSION.size
+            yield key, mm[offset:offset + value_len]
+            offset += value_len
+    finally:
+        mm.close()
+
+
+def iter_legacy(path):
+    '''Yield (key, encoded value) pairs from a JSON lines checkpoint'''
+
+    with open(path, "r") as fh:
+        for line in fh:
+            data = json.loads(line)
+            if "key" in data:
+                yield data["key"], json.dumps(data["value"]).encode('utf-8')
+
+
+def legacy_segment(path):
+    '''Return the log segment covered by a JSON lines checkpoint'''
+
+    with open(path, "r") as fh:
+        data = json.loads(fh.readline() or "{}")
+
+    return data.get("segment", -1)
+
+
+def read_checkpoint(path, expires=None, versions=None):
+    '''Open a checkpoint in either format; return the last log segment it
+    covers and an iterator over its (key, encoded value) pairs, which fills
+    in the expires and versions dictionaries (if given) as it goes'''
+
+    if (not os.path.exists(path) or os.path.getsize(path) == 0):
+        return -1, iter(())
+
+    if not is_binary(path):
+        return legacy_segment(path), iter_legacy(path)
+
+    mm, header = map_checkpoint(path)
+    segment, count = header[3], header[4]
+
+    return segment, iter_records(mm, count, expires, versions)
+
+
+def find_record(path, key):
+    '''Look a single key up in an indexed binary checkpoint without loading
+    it; return the encoded value or None'''
+
+    mm, header = map_checkpoint(path)
+
+    try:
+        flags, count, index_offset = header[2], header[4], header[5]
+        if not (flags & FLAG_INDEX):
+            raise ValueError(f'{path}: checkpoint has no key index')
+
+        key = key.encode('utf-8')
+        low, high = 0, count
+        while low < high:
+            mid = (low + high) // 2
+            offset, = OFFSET.unpack_from(mm, index_offset + mid * OFFSET.size)
+            key_len, value_len = RECORD.unpack_from(mm, offset)
+            offset += RECORD.size
+            found = mm[offset:offset + key_len]
+
+            if (found == key):
+                offset += key_len
+                if (value_len & EXPIRES):
+                    value_len ^= EXPIRES
+                    offset += DEADLINE.size
+                if (value_len & VERSIONED):
+                    value_len ^= VERSIONED
+                    offset += KEY_VERSION.size
+                return mm[offset:offset + value_len]
+            elif (found < key):
+                low = mid + 1
+            else:
+                high = mid
+
+        return None
+    finally:
+        mm.close()
+
+
+def convert_checkpoint(src, dst, index=False):
+    '''Rewrite a checkpoint (in either format) in the binary format'''
+
+    expires = {}
+    versions = {}
+    segment, records = read_checkpoint(src, expires, versions)
+
+    tmp_file = f'{dst}.tmp'
+    count = write_checkpoint(tmp_file, records, segment, index, expires=expires,
+        versions=versions)
+    os.rename(tmp_file, dst)
+
+    return count
+
+
+def get_cml_args():
+    '''Get source and optional destination checkpoint from command line'''
+
+    args = [arg for arg in sys.argv[1:] if arg != "--index"]
+    if (len(args) not in (1, 2)):
+        print(f'Usage: ./Checkpoint.py [--index] [CHECKPOINT] [OUTPUT]')
+        return None
+
+    src = args[0]
+    dst = args[1] if len(args) == 2 else src
+
+    return src, dst, "--index" in sys.argv
+
+
+def main():
+    '''Convert a JSON lines checkpoint to the binary format'''
+
+    args = get_cml_args()
+    if not args:
+        return 1
+
+    src, dst, index = args
+    count = convert_checkpoint(src, dst, index)
+    print(f'Converted {count} records from {src} to {dst}')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
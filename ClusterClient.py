@@ -11,140 +11,575 @@ import json
 import time
 import http.client
 import HashTableClient
-import hashlib
+import ConnectionPool
+import HashRing
 import sys
+import re
+import random
+import threading
+import concurrent.futures
+import collections
+import heapq
+
+
+# matches requested per page by scan_iter
+SCAN_PAGE = 100
+# number of recent write latencies kept per server
+LATENCY_SAMPLES = 1000
+# seconds an operation may take, retries included, before it gives up
+DEADLINE = 30
+# the longest wait before the first retry (seconds), doubled for every
+# later one up to RETRY_MAX; a random part of it is waited (jitter), so
+# that clients do not all retry at once
+RETRY_BASE = 0.05
+RETRY_MAX = 2
+# a lookup is also sent to the next replica if the first has not answered
+# within this percentile of recent lookup latencies (HEDGE_DELAY seconds
+# until there are HEDGE_SAMPLES of them), recomputed every HEDGE_SAMPLES
+HEDGE_PERCENTILE = 0.95
+HEDGE_DELAY = 0.01
+HEDGE_SAMPLES = 100
 
 
 class ClusterClient:
 
-    def __init__(self, n, k, proj_name):
-        '''Constructor for ClusterClient object'''
+    def __init__(self, n, k, proj_name, binary=False, vnodes=HashRing.VNODES,
+            deadline=DEADLINE):
+        '''Constructor for ClusterClient object; binary asks the servers for
+        the binary wire protocol, keys are placed on the servers with a
+        consistent hashing ring of vnodes points per server, and operations
+        give up after deadline seconds'''
 
         self.n = n
         self.k = k
         self.project = proj_name
+        self.binary = binary
+        self.deadline = deadline
         self.servers = {}
+        self.pool = ConnectionPool.ConnectionPool()
+        # sends the requests of one operation to several servers at once,
+        # with room for the hedged requests of lookups
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=2 * n)
+        # seconds each server recently took to acknowledge a write
+        self.latencies = collections.defaultdict(
+            lambda: collections.deque(maxlen=LATENCY_SAMPLES))
+        # seconds recent lookups took, and the delay before hedging one
+        self.lookup_latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.hedge_delay = HEDGE_DELAY
+        # retries, hedged lookups (and those the hedge answered first) and
+        # operations that gave up at their deadline
+        self.counters = collections.Counter()
+        # requests waiting for an answer from each server; a server that is
+        # slow to answer piles them up, and is read from last
+        self.inflight = collections.Counter()
+        # guards the counters, which are updated from the executor's threads
+        self.lock = threading.Lock()
 
         for i in range(n):
-            serv_name = proj_name + "-" + str(i)
-            new_client = HashTableClient.HashTableClient()
-            new_client.locate_server(serv_name)
+            self.add_server(proj_name + "-" + str(i))
 
-            if not new_client.server:
-                print('Error: Could not locate project in name server')
-                sys.exit()
+        self.ring = HashRing.HashRing(self.servers, vnodes)
+        # the ring before the cluster grew, while its keys are migrated
+        self.old_ring = None
 
-            self.servers[serv_name] = new_client
 
+    def add_server(self, serv_name):
+        '''Locate a server in the name server and add a client for it'''
 
-    def call_operation(self, client, message):
-        '''Helper function to call operation with appropriate server'''
+        new_client = HashTableClient.HashTableClient(self.pool, self.binary)
+        new_client.locate_server(serv_name)
+
+        if not new_client.server:
+            print('Error: Could not locate project in name server')
+            sys.exit()
+
+        self.servers[serv_name] = new_client
+
+
+    def expand(self, n):
+        '''Grow the cluster to n servers. Until finish_expansion, keys are
+        written to the servers they are placed on by both the old and the
+        new ring, and read from the new ones first, so that operations keep
+        working while the servers migrate the keys (see Rebalance.py)'''
+
+        self.old_ring = HashRing.HashRing(self.ring.nodes, self.ring.vnodes)
+
+        for i in range(self.n, n):
+            serv_name = self.project + "-" + str(i)
+            self.add_server(serv_name)
+            self.ring.add(serv_name)
+
+        self.n = n
+
+        # room to ask every server at once; the threads of the old executor
+        # finish what they were given and exit once it is no longer used
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=2 * n)
+
+
+    def finish_expansion(self):
+        '''Place keys with the new ring only, once every key was migrated'''
+
+        self.old_ring = None
+
+
+    def copies(self):
+        '''Return the most servers a key may be written to'''
+
+        return self.k if self.old_ring is None else 2 * self.k
+
+
+    def call_operation(self, client, message, timeout=None, patience=None):
+        '''Helper function to call operation with appropriate server; with a
+        timeout, a server that takes longer raises socket.timeout. With
+        patience, a server that has not answered within that many seconds
+        is waited for in the background, and a future of its response (see
+        call_server) is returned instead.'''
+
+        host = client.server["name"]
+        port = client.server["port"]
+
+        while True:
+            try:
+                sock, reused = client.acquire_connection(host, port, timeout)
+            except ConnectionRefusedError:
+                message = f"Could not connect to {host} at port {port}"
+                return {"status": "Failure",
+                        "error": message}
+
+            try:
+                client.send_request(sock, message)
+                if (patience is not None):
+                    sock.settimeout(min(patience, timeout or patience))
+                try:
+                    response = client.receive_response(sock)
+                except socket.timeout:
+                    if (patience is None):
+                        raise
+                    sock.settimeout(timeout)
+                    return self.executor.submit(self.guard, client,
+                            self.finish_operation, client, sock)
+            except socket.timeout:
+                # the server is slow rather than gone, so do not wait again
+                client.discard_connection(sock)
+                raise
+            except socket.error:
+                client.discard_connection(sock)
+                # a pooled connection may have been closed by the server
+                # while idle, so retry once on a fresh connection
+                if reused:
+                    continue
+                raise
+            except (KeyError, TypeError, ValueError, re.error):
+                # the server answered, so the connection is still usable
+                client.release_connection(host, port, sock)
+                raise
+            except BaseException:
+                client.discard_connection(sock)
+                raise
+
+            client.release_connection(host, port, sock)
+            return response
+
+
+    def finish_operation(self, client, sock):
+        '''Wait for the response to a request call_operation stopped waiting
+        for, and hand the connection back'''
 
         host = client.server["name"]
         port = client.server["port"]
 
         try:
-            sock = client.connect_to_server(host, port)
-        except ConnectionRefusedError:
-            message = f"Could not connect to {host} at port {port}"
-            return {"status": "Failure",
-                    "result": message}
+            response = client.receive_response(sock)
+        except (KeyError, TypeError, ValueError, re.error):
+            client.release_connection(host, port, sock)
+            raise
+        except BaseException:
+            client.discard_connection(sock)
+            raise
+
+        client.release_connection(host, port, sock)
+
+        return response
+
+
+    def pool_stats(self):
+        '''Return hit/miss counters of the shared connection pool'''
+
+        return self.pool.stats()
 
-        return client.process_request(sock, message)
 
+    def close(self):
+        '''Close all pooled connections to the servers'''
 
-    def insert(self, key, value):
-        '''Client stub to support insert operations'''
+        self.pool.close()
+
+
+    def insert(self, key, value, ttl=None):
+        '''Client stub to support insert operations; with a ttl the key
+        expires after that many seconds'''
 
         message = {
             "method": "insert",
             "key": key,
             "value": value
         }
+        if ttl is not None:
+            message["ttl"] = ttl
 
-        clients = self.find_clients(key)
+        return self.write(key, message)
 
-        response = None
-        for client in clients:
-            try:
-                response = self.call_operation(client, message)
-            except TypeError:
-                response = {
-                    "status": "Invalid Request",
-                    "error": "TypeError"
-                }
-                break
-            except ValueError:
-                response = {
-                    "status": "Invalid Request",
-                    "error": "ValueError"
-                }
+
+    def write(self, key, message):
+        '''Send a write to every replica of a key at once, and return once
+        they have all acknowledged it (or missed the deadline): an invalid
+        request if one was reported, then a replica's failure, otherwise
+        the last replica's response'''
+
+        responses = self.call_replicas(self.find_clients(key), message)
+
+        for status in ("Invalid Request", "Failure"):
+            for response in responses:
+                if (response["status"] == status):
+                    return response
+
+        return responses[-1] if responses else None
+
+
+    def call_replicas(self, clients, message):
+        '''Send a write to each of the given replica servers in parallel and
+        wait for all of them, so that a write takes as long as the slowest
+        replica rather than the sum of them; the responses come back in
+        order'''
+
+        if (len(clients) == 1):
+            return [self.call_replica(clients[0], message)]
+
+        futures = [self.executor.submit(self.call_replica, client, message)
+                for client in clients]
+
+        return [future.result() for future in futures]
+
+
+    def call_replica(self, client, message):
+        '''Send a write to one replica server, retrying while it cannot be
+        reached until the deadline, and record how long it took to
+        acknowledge'''
+
+        start = time.time()
+        deadline = start + self.deadline
+
+        attempt = 0
+        while True:
+            response = self.call_server(client, message, deadline)
+            if (response["status"] != "Failure"):
                 break
-            except socket.error:
-                response = {
-                    "status": "Failure",
-                    "error": "socket.error"
-                }
-            while (response["status"] == "Failure"):
-                # sleep for 5 seconds and then retry
-                time.sleep(5)
-                client.locate_server(client.server["project"])
-                response = self.call_operation(client, message)
+            if not self.backoff(attempt, deadline):
+                return response
+            client.locate_server(client.server["project"])
+            attempt += 1
+
+        self.latencies[client.server["project"]].append(time.time() - start)
+
+        return response
+
+
+    def call_server(self, client, message, deadline, patience=None):
+        '''Send a request to one server, giving up at the deadline; with
+        patience, the result may be a future of the response (see
+        call_operation)'''
+
+        timeout = max(deadline - time.time(), 0.001)
+
+        return self.guard(client, self.call_operation, client, message, timeout, patience)
+
+
+    def guard(self, client, operation, *args):
+        '''Run an operation on a server; errors are returned in the response
+        instead of raised (a missing key is a success with a KeyError)'''
+
+        name = client.server["project"]
+        with self.lock:
+            self.inflight[name] += 1
+
+        try:
+            return operation(*args)
+        except TypeError:
+            return {
+                "status": "Invalid Request",
+                "error": "TypeError"
+            }
+        except KeyError:
+            return {
+                "status": "Success",
+                "error": "KeyError"
+            }
+        except ValueError:
+            return {
+                "status": "Invalid Request",
+                "error": "ValueError"
+            }
+        except re.error:
+            return {
+                "status": "Invalid Request",
+                "error": "re.error"
+            }
+        except socket.error:
+            return {
+                "status": "Failure",
+                "error": "socket.error"
+            }
+        finally:
+            with self.lock:
+                self.inflight[name] -= 1
+
+
+    def backoff(self, attempt, deadline):
+        '''Wait before retry number attempt (from 0): a random part of a
+        wait that doubles with every attempt. Return False, without
+        waiting, if the retry could not be made before the deadline.'''
+
+        delay = random.uniform(0, min(RETRY_MAX, RETRY_BASE * 2 ** attempt))
+        if (time.time() + delay >= deadline):
+            self.count("deadlines_missed")
+            return False
+
+        time.sleep(delay)
+        self.count("retries")
+
+        return True
+
+
+    def count(self, name):
+        '''Add one to a counter of retry_stats'''
+
+        with self.lock:
+            self.counters[name] += 1
+
+
+    def retry_stats(self):
+        '''Return the number of retries, hedged lookups, lookups answered
+        by their hedge first and operations that missed their deadline,
+        along with the current hedge delay (ms)'''
+
+        with self.lock:
+            stats = {name: self.counters[name]
+                    for name in ("retries", "hedges", "hedges_won", "deadlines_missed")}
+        stats["hedge_delay_ms"] = 1000 * self.hedge_delay
+
+        return stats
+
+
+    def write_latency(self):
+        '''Return the number of recent writes acknowledged by each server and
+        their mean, median, 99th percentile and largest latency (ms)'''
+
+        results = {}
+        for serv_name, samples in self.latencies.items():
+            samples = sorted(samples)
+            if not samples:
+                continue
+            results[serv_name] = {
+                "writes": len(samples),
+                "mean_ms": 1000 * sum(samples) / len(samples),
+                "p50_ms": 1000 * samples[len(samples) // 2],
+                "p99_ms": 1000 * samples[int(len(samples) * 0.99)],
+                "max_ms": 1000 * samples[-1]
+            }
+
+        return results
+
+
+    def incr(self, key, amount=1):
+        '''Add amount to the integer value of a key (0 if it is missing) on
+        every replica; the result is the new value'''
+
+        message = {
+            "method": "incr",
+            "key": key,
+            "amount": amount
+        }
+
+        return self.write(key, message)
+
+
+    def append(self, key, value):
+        '''Append a value to the list (or string) value of a key on every
+        replica; the result is the new length'''
+
+        message = {
+            "method": "append",
+            "key": key,
+            "value": value
+        }
+
+        return self.write(key, message)
+
+
+    def cas(self, key, version, value):
+        '''Set the value of a key if it is still at the given version (see
+        lookup with version). The first replica decides; if it swapped the
+        value, the others are given the new value and version whatever
+        version they were at, and a replica that could not be written is
+        reported as for other writes. While the cluster grows, the first
+        replica may not have the key until it is migrated, so a cas can
+        fail and has to be retried.'''
+
+        message = {
+            "method": "cas",
+            "key": key,
+            "version": version,
+            "value": value
+        }
+
+        clients = self.find_clients(key)
+        response = self.call_replicas(clients[:1], message)[0]
+        if (response["status"] != "Success"):
+            return response
+
+        result = response["result"]
+        if not result["swapped"]:
+            return response
+
+        copy = {
+            "method": "replicate",
+            "key": key,
+            "value": value,
+            "version": result["version"]
+        }
+        for other in self.call_replicas(clients[1:], copy):
+            if (other["status"] != "Success"):
+                return other
 
         return response
 
 
-    def lookup(self, key):
-        '''Client stub to support lookup operations'''
+    def lookup(self, key, version=False):
+        '''Client stub to support lookup operations; with version the result
+        is the value along with the key's version, for use with cas. While
+        the cluster grows, a key missing from its new servers is read from
+        its old ones.'''
 
         message = {
             "method": "lookup",
             "key": key,
         }
+        if version:
+            message["version"] = True
         
-        clients = self.find_clients(key)
-        
-        key_errors = 0
-        response = None
-        while (1):
-            for client in clients:
-                try:
-                    response = self.call_operation(client, message)
-                except TypeError: 
-                    return {
-                        "status": "Invalid Request",
-                        "error": "TypeError"
-                    }
-                except KeyError:
-                    response = {
-                        "status": "Success",
-                        "error": "KeyError"
-                    }
-                    key_errors += 1
-                except ValueError:
-                    return {
-                        "status": "Invalid Request",
-                        "error": "ValueError"
-                    }
-                except socket.error:
-                    response = {
-                        "status": "Failure",
-                        "error": "socket.error"
-                    }
-                if (response["status"] == "Success"):
-                    return response
-        
-            if (key_errors == len(clients)):
+        start = time.time()
+        deadline = start + self.deadline
+
+        attempt = 0
+        while True:
+            response = self.hedged_read(self.find_clients(key), message, deadline)
+            if (response["status"] != "Failure"):
+                break
+            if not self.backoff(attempt, deadline):
                 return response
-            else:
-                key_errors = 0
+            attempt += 1
 
-            # sleep for 5 seconds and then retry
-            time.sleep(5)
-            clients = self.find_clients(key)
+        self.record_lookup(time.time() - start)
 
         return response
-       
+
+
+    def hedged_read(self, clients, message, deadline):
+        '''Send a read to the replicas in clients in order: the next one is
+        asked as soon as the ones before have failed, or as a hedge if they
+        have not answered within the hedge delay. Return the first answer;
+        a missing key is only the answer once every replica reported it
+        while the cluster grows. Otherwise return a failure.'''
+
+        if (len(clients) == 1):
+            return self.call_server(clients[0], message, deadline)
+
+        # replicas still busy with earlier requests are asked last
+        waiting = sorted(clients, key=lambda client: self.inflight[client.server["project"]] > 0)
+        first = waiting.pop(0)
+        pending = {}
+        response = None
+        key_errors = 0
+        hedged = False
+
+        def ask_next():
+            client = waiting.pop(0)
+            future = self.executor.submit(self.call_server, client, message, deadline)
+            pending[future] = client
+
+        # the first replica is asked in this thread, and only left to answer
+        # in the background (while the next is asked) if it is slow
+        answer = self.call_server(first, message, deadline, self.hedge_delay)
+        if isinstance(answer, concurrent.futures.Future):
+            pending[answer] = first
+            self.count("hedges")
+            hedged = True
+            ask_next()
+        elif self.is_answer(answer):
+            return answer
+        else:
+            future = concurrent.futures.Future()
+            future.set_result(answer)
+            pending[future] = first
+
+        while pending:
+            timeout = self.hedge_delay if waiting else deadline - time.time()
+            done, _ = concurrent.futures.wait(pending, max(timeout, 0),
+                    concurrent.futures.FIRST_COMPLETED)
+
+            if not done:
+                if not waiting:
+                    break
+                self.count("hedges")
+                hedged = True
+                ask_next()
+                continue
+
+            for future in done:
+                client = pending.pop(future)
+                response = future.result()
+                if not self.is_answer(response):
+                    key_errors += (response["status"] != "Failure")
+                    if waiting:
+                        ask_next()
+                    continue
+                if (hedged and client is not first):
+                    self.count("hedges_won")
+                return response
+
+        if (key_errors and key_errors == len(clients)):
+            return response
+
+        return {
+            "status": "Failure",
+            "error": "socket.error" if response else "deadline"
+        }
+
+
+    def is_answer(self, response):
+        '''Return whether a read's response is its answer, rather than a
+        failure or (while the cluster grows) a key that may not have been
+        migrated yet'''
+
+        if (response["status"] == "Failure"):
+            return False
+
+        return not (self.old_ring and response.get("error") == "KeyError")
+
+
+    def record_lookup(self, seconds):
+        '''Record how long a lookup took, and every HEDGE_SAMPLES lookups
+        make the hedge delay the HEDGE_PERCENTILE of recent ones'''
+
+        samples = self.lookup_latencies
+        with self.lock:
+            samples.append(seconds)
+            self.counters["lookups"] += 1
+            if (self.counters["lookups"] % HEDGE_SAMPLES != 0):
+                return
+            ordered = sorted(samples)
+
+        self.hedge_delay = ordered[int(len(ordered) * HEDGE_PERCENTILE)]
+
 
     def remove(self, key):
         '''Client stub to support remove operations'''
@@ -153,118 +588,397 @@ class ClusterClient:
             "method": "remove",
             "key": key
         }
-        
-        clients = self.find_clients(key)
 
-        response = None
-        for client in clients:
-            try: 
-                response = self.call_operation(client, message)
-            except TypeError: 
+        return self.write(key, message)
+
+
+    def scan(self, regex, routed=False):
+        '''Client stub to support scan operations. Every server is asked at
+        once and the matches are merged as the servers answer. If routed,
+        each server only sends the keys placed on it (see HashRing) rather
+        than every key it holds a replica of, and the keys of a server that
+        cannot be reached are asked from the others. Scans are not routed
+        while the cluster grows, as keys may not be on their servers yet.'''
+
+        routed = routed and self.old_ring is None
+        message = {
+            "method": "scan",
+            "regex": regex,
+        }
+
+        futures = [self.executor.submit(self.scan_server, name, message, routed)
+                for name in self.servers]
+
+        results = {}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                response = future.result()
+            except TypeError:
                 return {
                     "status": "Invalid Request",
                     "error": "TypeError"
                 }
-            except KeyError:
-                response = {
-                    "status": "Success",
-                    "error": "KeyError"
-                }
             except ValueError:
                 return {
                     "status": "Invalid Request",
                     "error": "ValueError"
-                } 
+                }
+            except re.error:
+                return {
+                    "status": "Invalid Request",
+                    "error": "re.error"
+                }
             except socket.error:
-                response = {
+                return {
                     "status": "Failure",
                     "error": "socket.error"
                 }
-            while (response["status"] == "Failure"):
-                # sleep for 5 seconds and then retry
-                time.sleep(5)
-                client.locate_server(client.server["project"])
-                response = self.call_operation(client, message)
 
-        return response
+            for item in response["result"]:
+                results[item[0]] = item
 
+        return {"status": "Success", "result": list(results.values())}
 
-    def scan(self, regex):
-        '''Client stub to support scan operations'''
 
-        message = {
-            "method": "scan",
-            "regex": regex,
+    def placed_on(self, name, message):
+        '''Restrict a scan to the keys placed on a server; the server works
+        out their placement from the nodes of the ring'''
+
+        partition = {
+            "nodes": self.ring.nodes,
+            "vnodes": self.ring.vnodes,
+            "owner": name
         }
 
-        response = None
+        return dict(message, partition=partition)
+
+
+    def scan_server(self, name, message, routed):
+        '''Send a scan to one server (see scan); invalid requests raise as
+        in call_operation'''
+
+        if not routed:
+            return self.scan_slot(name, message)
+
+        message = self.placed_on(name, message)
+        response = self.scan_slot(name, message, self.k > 1)
+        if response is not None:
+            return response
+
+        # every key placed on the server has a replica on another one
         results = {}
-        for client in self.servers.values():
+        for other in self.servers:
+            if (other != name):
+                response = self.scan_slot(other, message, True)
+                for item in response["result"] if response else ():
+                    results[item[0]] = item
+
+        return {"status": "Success", "result": list(results.values())}
+
+
+    def scan_slot(self, name, message, failover=False):
+        '''Send a scan (or a page of one) to a server, retrying if it cannot
+        be reached until the deadline, when socket.timeout is raised; with
+        failover, None is returned instead of retrying'''
+
+        client = self.servers[name]
+        deadline = time.time() + self.deadline
+
+        attempt = 0
+        while True:
             try:
-                response = self.call_operation(client, message)
-            except TypeError: 
-                return {
-                    "status": "Invalid Request",
-                    "error": "TypeError"
-                }
-            except ValueError:
-                return {
-                    "status": "Invalid Request",
-                    "error": "ValueError"
-                }
+                response = self.call_operation(client, message, max(deadline - time.time(), 0.001))
             except socket.error:
                 response = {
                     "status": "Failure",
                     "error": "socket.error"
                 }
-            while (response["status"] == "Failure"):
-                # sleep for 5 seconds and then retry
-                time.sleep(5)
-                clients = self.find_clients(key)
-                response = self.call_operation(client, message)
-            
-            if (type(response["result"]) == str):
+            if (response["status"] != "Failure"):
                 return response
-            
-            for item in response["result"]:
-                results[item[0]] = item
+            if failover:
+                return None
 
-        response["result"] = list(results.values())
+            if not self.backoff(attempt, deadline):
+                raise socket.timeout(f'{name} did not answer the scan in time')
+            client.locate_server(client.server["project"])
+            attempt += 1
 
-        return response
-        
 
-    def hash_server(self, key):
-        '''Function that returns a hash value for a given key'''
+    def scan_pages(self, name, message, routed, replica=False):
+        '''Request the first page of a paged scan of one server and return a
+        generator of its matches in key order'''
+
+        failover = routed and self.k > 1
+        future = self.executor.submit(self.scan_slot, name, message, failover)
+
+        return self.page_items(name, message, future, routed, replica)
+
+
+    def page_items(self, name, message, future, routed, replica):
+        '''Yield the matches of a paged scan of one server a page at a time,
+        asking for the next page while this one is consumed. Since the
+        cursor is just the last key seen, a page that fails is retried from
+        the same cursor; if routed, the rest of the keys placed on the
+        server are read from the other servers instead (replica is set for
+        those, which just end if they fail too).'''
+
+        while True:
+            response = future.result()
+            if response is None:
+                if not replica:
+                    streams = [self.scan_pages(other, message, routed, True)
+                            for other in self.servers if other != name]
+                    yield from heapq.merge(*streams, key=lambda item: item[0])
+                return
+
+            page = response["result"]
+            cursor = page["cursor"]
+            if cursor is not None:
+                message = dict(message, cursor=cursor)
+                future = self.executor.submit(self.scan_slot, name, message,
+                    routed and self.k > 1)
+
+            for key, value in page["items"]:
+                yield key, value
+
+            if cursor is None:
+                return
+
+
+    def scan_iter(self, regex, limit=SCAN_PAGE, routed=False):
+        '''Generate the (key, value) pairs matching regex from every server
+        in key order, fetching pages of limit matches at a time so that
+        memory stays bounded however many keys match; replicated keys are
+        only generated once, and only sent once if routed (see scan).
+        Invalid requests raise as in call_operation, and socket.timeout is
+        raised if a server cannot be reached within the deadline.'''
+
+        routed = routed and self.old_ring is None
+        message = {
+            "method": "scan",
+            "regex": regex,
+            "cursor": None,
+            "limit": limit
+        }
+
+        # the first pages of every server are fetched together
+        streams = []
+        for name in self.servers:
+            paged = self.placed_on(name, message) if routed else message
+            streams.append(self.scan_pages(name, paged, routed))
+
+        last = None
+        for key, value in heapq.merge(*streams, key=lambda item: item[0]):
+            if (key != last):
+                yield key, value
+                last = key
+
+
+    def range(self, start, end, limit=SCAN_PAGE, reverse=False):
+        '''Return up to limit (key, value) pairs with start <= key < end, in
+        key order or in reverse, by asking every server in parallel and
+        merging their sorted results; replicated keys appear once, and up
+        to k - 1 unreachable servers are covered by the replicas'''
+
+        message = {
+            "method": "range",
+            "start": start,
+            "end": end,
+            "limit": limit,
+            "reverse": reverse
+        }
+
+        batches = [(client, message) for client in self.servers.values()]
+
+        results = []
+        failures = 0
+        for response in self.call_batches(batches):
+            if (response["status"] == "Failure"):
+                failures += 1
+                if (failures >= self.k):
+                    return response
+            elif "error" in response:
+                return response
+            else:
+                results.append(response["result"])
+
+        items = []
+        for key, value in heapq.merge(*results, key=lambda item: item[0], reverse=reverse):
+            if (len(items) == limit):
+                break
+            if not (items and items[-1][0] == key):
+                items.append([key, value])
+
+        return {"status": "Success", "result": items}
+
+
+    def group_keys(self, keys, replica=0):
+        '''Group keys by the HashTableClient of the server holding the given
+        replica of each of them'''
+
+        groups = {}
+        for key in keys:
+            clients = self.find_clients(key)
+            if (replica < len(clients)):
+                groups.setdefault(clients[replica], []).append(key)
+
+        return groups
+
+
+    def call_batch(self, client, message):
+        '''Send a batch request to one server; errors are returned in the
+        response instead of raised'''
 
         try:
-            hash_digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
-            hash_num = int(hash_digest, 16)
+            return self.call_operation(client, message, self.deadline)
+        except TypeError:
+            return {"status": "Invalid Request", "error": "TypeError"}
+        except KeyError:
+            return {"status": "Invalid Request", "error": "KeyError"}
+        except ValueError:
+            return {"status": "Invalid Request", "error": "ValueError"}
+        except re.error:
+            return {"status": "Invalid Request", "error": "re.error"}
+        except socket.error:
+            return {"status": "Failure", "error": "socket.error"}
 
-            return hash_num % self.n
 
-        # return 0 for the server is key can't be hashed
-        # will throw invalid request response later
-        except AttributeError:
-            return 0
+    def call_batches(self, batches):
+        '''Send one batch request per server in parallel; batches is a list
+        of (client, message) pairs, and the responses come back in order'''
 
+        futures = [self.executor.submit(self.call_batch, client, message)
+                for client, message in batches]
 
-    def find_clients(self, key):
-        '''Function that locates the HashTableClient object associated
-        with the correct server'''
+        return [future.result() for future in futures]
+
+
+    def mget(self, keys):
+        '''Look up a list of keys with one request per server; keys held by
+        a server that cannot be reached are read from their next replica,
+        as are keys missing from their new servers while the cluster grows'''
+
+        if (type(keys) not in (list, tuple)):
+            return {"status": "Invalid Request", "error": "TypeError"}
+
+        results = {}
+        pending = list(keys)
+        failure = None
+
+        for replica in range(self.copies()):
+            if not pending:
+                break
+
+            groups = self.group_keys(pending, replica)
+            batches = [(client, {"method": "mget", "keys": group})
+                    for client, group in groups.items()]
+
+            pending = []
+            failure = None
+            for (_, message), response in zip(batches, self.call_batches(batches)):
+                if (response["status"] == "Failure"):
+                    pending += message["keys"]
+                    failure = response
+                elif "error" in response:
+                    return response
+                else:
+                    results.update(response["result"])
+                    if self.old_ring:
+                        pending += [key for key in message["keys"] if key not in response["result"]]
 
-        clients = []
-        server_num = self.hash_server(key)
+        if failure:
+            return failure
 
-        for _ in range(self.k):
+        return {"status": "Success", "result": results}
 
-            if (server_num >= self.n):
-                server_num = 0
 
-            serv_name = self.project + "-" + str(server_num)
-            clients.append(self.servers[serv_name])
-            
-            server_num += 1
+    def mput(self, items, ttl=None):
+        '''Insert a dictionary of keys and values, sending every replica
+        server one batch with its keys; with a ttl the keys expire after
+        that many seconds'''
+
+        if (type(items) != dict):
+            return {"status": "Invalid Request", "error": "TypeError"}
+
+        batches = []
+        for replica in range(self.copies()):
+            for client, group in self.group_keys(items, replica).items():
+                batch = {key: items[key] for key in group}
+                message = {"method": "mput", "items": batch}
+                if ttl is not None:
+                    message["ttl"] = ttl
+                batches.append((client, message))
+
+        for response in self.call_batches(batches):
+            if "error" in response:
+                return response
+
+        return {"status": "Success", "result": len(items)}
+
+
+    def mremove(self, keys):
+        '''Remove a list of keys, sending every replica server one batch
+        with its keys; the result maps each removed key to its value'''
+
+        if (type(keys) not in (list, tuple)):
+            return {"status": "Invalid Request", "error": "TypeError"}
+
+        batches = []
+        for replica in range(self.copies()):
+            for client, group in self.group_keys(keys, replica).items():
+                batches.append((client, {"method": "mremove", "keys": group}))
+
+        results = {}
+        for response in self.call_batches(batches):
+            if "error" in response:
+                return response
+            results.update(response["result"])
+
+        return {"status": "Success", "result": results}
+
+
+    def stats(self):
+        '''Return the counters of every server, keyed by server name'''
+
+        message = {
+            "method": "stats"
+        }
+
+        results = {}
+        for serv_name, client in self.servers.items():
+            try:
+                response = self.call_operation(client, message, self.deadline)
+            except socket.error:
+                response = {
+                    "status": "Failure",
+                    "error": "socket.error"
+                }
+            results[serv_name] = response.get("result", response)
+
+        return results
+
+
+    def hash_server(self, key):
+        '''Function that returns the name of the server a key is placed on'''
+
+        return self.ring.node_of(key)
+
+
+    def find_clients(self, key):
+        '''Function that locates the HashTableClient objects of the k servers
+        holding a key, starting with the one it is placed on; while the
+        cluster grows, they are followed by its servers under the old ring'''
+
+        try:
+            names = self.ring.nodes_of(key, self.k)
+            if self.old_ring:
+                names += tuple(name for name in self.old_ring.nodes_of(key, self.k)
+                        if name not in names)
+
+        # use the first servers if the key can't be hashed
+        # will throw invalid request response later
+        except AttributeError:
+            names = self.ring.nodes[:self.k]
 
-        return clients
+        return [self.servers[name] for name in names]
 
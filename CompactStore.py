@@ -0,0 +1,276 @@
+# CompactStore.py
+# Author: Kristen Friday
+# Date: October 18, 2026
+
+# A compact storage engine for HashTable: a mapping of str keys to bytes
+# values that keeps every entry as a record in one bytearray arena instead
+# of as Python objects. The arena is indexed by an open-addressing table
+# (linear probing) of record offsets and 32-bit key hashes held in two
+# arrays, so an entry costs its key and value bytes, an 8-byte record
+# header and about 24 bytes of table, against well over 100 bytes for a
+# dict entry with str and bytes objects.
+#
+# Record layout: key length (u32), value length (u32), utf-8 key, value.
+# Overwriting a value of the same length happens in place; anything else
+# appends a new record, and the arena is compacted once more than half of
+# it is dead records.
+
+import sys
+import array
+import struct
+
+
+RECORD = struct.Struct('<II')
+# offsets of slots that are free, or whose entry was removed
+EMPTY = -1
+DELETED = -2
+INITIAL_SLOTS = 8
+# grow the table once this share of the slots (live or deleted) is used
+MAX_LOAD = 0.7
+# only compact arenas with at least this many dead bytes
+MIN_GARBAGE = 64 * 1024
+
+
+class CompactStore:
+
+    '''A dict-like mapping of str keys to bytes values stored in an arena'''
+
+    def __init__(self, items=()):
+        '''Initialize an empty store, then add items'''
+
+        self.arena = bytearray()
+        self.garbage = 0
+        self.size = 0
+        self.resize(INITIAL_SLOTS)
+        self.update(items)
+
+
+    def resize(self, capacity):
+        '''Rebuild the table of slots with the given (power of 2) capacity,
+        dropping deleted slots'''
+
+        old_offsets = getattr(self, "offsets", ())
+        old_hashes = getattr(self, "hashes", ())
+
+        self.mask = capacity - 1
+        self.offsets = array.array('q', [EMPTY]) * capacity
+        self.hashes = array.array('I', [0]) * capacity
+        self.filled = self.size
+
+        for offset, h in zip(old_offsets, old_hashes):
+            if (offset < 0):
+                continue
+            i = h & self.mask
+            while (self.offsets[i] != EMPTY):
+                i = (i + 1) & self.mask
+            self.offsets[i] = offset
+            self.hashes[i] = h
+
+
+    def find(self, key_bytes, h):
+        '''Return the slot of a key and True, or the slot a new entry for it
+        would take and False'''
+
+        arena = self.arena
+        offsets = self.offsets
+        hashes = self.hashes
+        mask = self.mask
+        key_len = len(key_bytes)
+
+        free = -1
+        i = h & mask
+        while True:
+            offset = offsets[i]
+            if (offset == EMPTY):
+                return (free if free >= 0 else i), False
+
+            if (offset == DELETED):
+                if (free < 0):
+                    free = i
+            elif (hashes[i] == h and RECORD.unpack_from(arena, offset)[0] == key_len):
+                start = offset + RECORD.size
+                if (arena[start:start + key_len] == key_bytes):
+                    return i, True
+
+            i = (i + 1) & mask
+
+
+    def read_value(self, offset):
+        '''Return the value of the record at offset'''
+
+        key_len, value_len = RECORD.unpack_from(self.arena, offset)
+        start = offset + RECORD.size + key_len
+
+        return bytes(self.arena[start:start + value_len])
+
+
+    def read_key(self, offset):
+        '''Return the key of the record at offset'''
+
+        key_len, _ = RECORD.unpack_from(self.arena, offset)
+        start = offset + RECORD.size
+
+        return self.arena[start:start + key_len].decode('utf-8')
+
+
+    def __len__(self):
+        '''Return the number of entries'''
+
+        return self.size
+
+
+    def __contains__(self, key):
+        '''Return whether key is present'''
+
+        return self.find(key.encode('utf-8'), hash(key) & 0xFFFFFFFF)[1]
+
+
+    def __getitem__(self, key):
+        '''Return the value of key; raise KeyError if it is not present'''
+
+        i, found = self.find(key.encode('utf-8'), hash(key) & 0xFFFFFFFF)
+        if not found:
+            raise KeyError(key)
+
+        return self.read_value(self.offsets[i])
+
+
+    def get(self, key, default=None):
+        '''Return the value of key, or default if it is not present'''
+
+        i, found = self.find(key.encode('utf-8'), hash(key) & 0xFFFFFFFF)
+        if not found:
+            return default
+
+        return self.read_value(self.offsets[i])
+
+
+    def __setitem__(self, key, value):
+        '''Set the value of key'''
+
+        if not isinstance(value, (bytes, bytearray)):
+            raise TypeError('CompactStore values must be bytes')
+
+        key_bytes = key.encode('utf-8')
+        h = hash(key) & 0xFFFFFFFF
+        i, found = self.find(key_bytes, h)
+
+        if found:
+            offset = self.offsets[i]
+            key_len, value_len = RECORD.unpack_from(self.arena, offset)
+            if (value_len == len(value)):
+                start = offset + RECORD.size + key_len
+                self.arena[start:start + value_len] = value
+                return
+            self.garbage += RECORD.size + key_len + value_len
+        else:
+            if (self.offsets[i] == EMPTY):
+                self.filled += 1
+            self.hashes[i] = h
+            self.size += 1
+
+        self.offsets[i] = len(self.arena)
+        self.arena += RECORD.pack(len(key_bytes), len(value))
+        self.arena += key_bytes
+        self.arena += value
+
+        if (self.filled > MAX_LOAD * (self.mask + 1)):
+            # at most half full afterwards; deleted slots are dropped
+            capacity = INITIAL_SLOTS
+            while (self.size * 2 >= capacity):
+                capacity *= 2
+            self.resize(capacity)
+        elif found:
+            self.maybe_compact()
+
+
+    def pop(self, key, *default):
+        '''Remove key and return its value, or default if it is not present'''
+
+        i, found = self.find(key.encode('utf-8'), hash(key) & 0xFFFFFFFF)
+        if not found:
+            if default:
+                return default[0]
+            raise KeyError(key)
+
+        offset = self.offsets[i]
+        value = self.read_value(offset)
+        key_len, value_len = RECORD.unpack_from(self.arena, offset)
+
+        self.offsets[i] = DELETED
+        self.size -= 1
+        self.garbage += RECORD.size + key_len + value_len
+        self.maybe_compact()
+
+        return value
+
+
+    def __delitem__(self, key):
+        '''Remove key; raise KeyError if it is not present'''
+
+        self.pop(key)
+
+
+    def maybe_compact(self):
+        '''Rewrite the arena without dead records once they are most of it'''
+
+        if (self.garbage < MIN_GARBAGE or self.garbage * 2 < len(self.arena)):
+            return
+
+        arena = bytearray()
+        for i, offset in enumerate(self.offsets):
+            if (offset < 0):
+                continue
+            key_len, value_len = RECORD.unpack_from(self.arena, offset)
+            self.offsets[i] = len(arena)
+            arena += self.arena[offset:offset + RECORD.size + key_len + value_len]
+
+        self.arena = arena
+        self.garbage = 0
+
+
+    def update(self, items):
+        '''Set the value of every (key, value) pair of items or a mapping'''
+
+        if hasattr(items, "items"):
+            items = items.items()
+
+        for key, value in items:
+            self[key] = value
+
+
+    def __iter__(self):
+        '''Yield every key'''
+
+        for offset in self.offsets:
+            if (offset >= 0):
+                yield self.read_key(offset)
+
+
+    def keys(self):
+        '''Yield every key'''
+
+        return iter(self)
+
+
+    def values(self):
+        '''Yield every value'''
+
+        for offset in self.offsets:
+            if (offset >= 0):
+                yield self.read_value(offset)
+
+
+    def items(self):
+        '''Yield every (key, value) pair'''
+
+        for offset in self.offsets:
+            if (offset >= 0):
+                yield self.read_key(offset), self.read_value(offset)
+
+
+    def memory_bytes(self):
+        '''Return the memory held by the arena and the table of slots'''
+
+        return (sys.getsizeof(self.arena) + sys.getsizeof(self.offsets) +
+                sys.getsizeof(self.hashes))
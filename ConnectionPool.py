@@ -0,0 +1,139 @@
+# ConnectionPool.py
+# Author: Kristen Friday
+# Date: October 18, 2026
+
+# Keeps persistent TCP connections to each hash table server so that
+# clients do not pay for a name lookup and TCP handshake on every operation
+
+import select
+import threading
+import time
+
+
+# maximum number of idle connections kept for a single server
+MAX_IDLE = 8
+# close idle connections that have not been used for this many seconds
+IDLE_TIMEOUT = 60
+
+
+class ConnectionPool:
+
+    '''A bounded, thread-safe pool of idle connections keyed by (host, port)'''
+
+    def __init__(self, max_idle=MAX_IDLE, idle_timeout=IDLE_TIMEOUT):
+        '''Initialize an empty pool and its hit/miss counters'''
+
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.unhealthy = 0
+        self.discarded = 0
+
+
+    def is_healthy(self, sock):
+        '''Check that an idle connection has not been closed by the server.
+        An idle socket should never be readable: readable means either EOF
+        or stray bytes, and in both cases the connection cannot be reused.'''
+
+        if sock.fileno() < 0:
+            return False
+
+        # poll rather than select, which cannot watch descriptors >= 1024;
+        # a hang-up or error is reported even though only POLLIN is asked
+        poller = select.poll()
+        try:
+            poller.register(sock, select.POLLIN)
+            events = poller.poll(0)
+        except (OSError, ValueError):
+            return False
+
+        return not events
+
+
+    def acquire(self, host, port):
+        '''Return a healthy idle connection to (host, port), or None if the
+        caller has to open a new one'''
+
+        now = time.monotonic()
+
+        with self.lock:
+            conns = self.idle.get((host, port), [])
+            while conns:
+                sock, last_used = conns.pop()
+                if (now - last_used > self.idle_timeout):
+                    self.expired += 1
+                    sock.close()
+                    continue
+                if not self.is_healthy(sock):
+                    self.unhealthy += 1
+                    sock.close()
+                    continue
+
+                self.hits += 1
+                return sock
+
+            self.misses += 1
+
+        return None
+
+
+    def release(self, host, port, sock):
+        '''Return a connection to the pool once a request has completed'''
+
+        now = time.monotonic()
+
+        with self.lock:
+            conns = self.idle.setdefault((host, port), [])
+
+            # drop connections that expired while sitting in the pool
+            while conns and now - conns[0][1] > self.idle_timeout:
+                old_sock, _ = conns.pop(0)
+                self.expired += 1
+                old_sock.close()
+
+            if (len(conns) >= self.max_idle):
+                sock.close()
+                return
+
+            conns.append((sock, now))
+
+
+    def discard(self, sock):
+        '''Close a connection that failed and must not be reused'''
+
+        with self.lock:
+            self.discarded += 1
+
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+
+    def close(self):
+        '''Close every idle connection held by the pool'''
+
+        with self.lock:
+            for conns in self.idle.values():
+                for sock, _ in conns:
+                    sock.close()
+            self.idle = {}
+
+
+    def stats(self):
+        '''Return the pool counters as a dictionary'''
+
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "unhealthy": self.unhealthy,
+                "discarded": self.discarded,
+                "idle": sum(len(conns) for conns in self.idle.values())
+            }
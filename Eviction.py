@@ -0,0 +1,171 @@
+# Eviction.py
+# Author: Kristen Friday
+# Date: October 18, 2026
+
+# Eviction policies for a HashTable used as a cache with a bound on its
+# size. A policy is told about every key that is added, accessed or
+# removed, and names the key to evict when the table is over its limits.
+
+import random
+import collections
+
+
+# number of keys SampledLRUPolicy compares to pick a victim
+EVICTION_SAMPLES = 5
+
+
+class LRUPolicy:
+
+    '''Evicts the least recently used key'''
+
+    def __init__(self):
+        '''Initialize an empty recency order'''
+
+        self.order = collections.OrderedDict()
+
+
+    def add(self, key):
+        '''Track a new key as the most recently used'''
+
+        self.order[key] = None
+
+
+    def touch(self, key):
+        '''Mark a key as the most recently used'''
+
+        self.order.move_to_end(key)
+
+
+    def discard(self, key):
+        '''Stop tracking a removed key'''
+
+        self.order.pop(key, None)
+
+
+    def victim(self):
+        '''Return the key to evict'''
+
+        return next(iter(self.order))
+
+
+class LFUPolicy:
+
+    '''Evicts the least frequently used key, and the least recently used
+    of those if several are used equally often'''
+
+    def __init__(self):
+        '''Initialize empty use counts'''
+
+        self.counts = {}
+        # keys by use count, each in recency order
+        self.buckets = {}
+        self.min_count = 0
+
+
+    def add(self, key):
+        '''Track a new key as used once'''
+
+        self.counts[key] = 1
+        self.buckets.setdefault(1, collections.OrderedDict())[key] = None
+        self.min_count = 1
+
+
+    def touch(self, key):
+        '''Count a use of a key'''
+
+        count = self.counts[key]
+        self.remove_from_bucket(key, count)
+        if (self.min_count == count and count not in self.buckets):
+            self.min_count = count + 1
+
+        self.counts[key] = count + 1
+        self.buckets.setdefault(count + 1, collections.OrderedDict())[key] = None
+
+
+    def discard(self, key):
+        '''Stop tracking a removed key'''
+
+        count = self.counts.pop(key, None)
+        if count is not None:
+            self.remove_from_bucket(key, count)
+
+
+    def remove_from_bucket(self, key, count):
+        '''Take a key out of the bucket of its use count'''
+
+        bucket = self.buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[count]
+
+
+    def victim(self):
+        '''Return the key to evict'''
+
+        if self.min_count not in self.buckets:
+            self.min_count = min(self.buckets)
+
+        return next(iter(self.buckets[self.min_count]))
+
+
+class SampledLRUPolicy:
+
+    '''Approximates LRU by evicting the least recently used of a few keys
+    sampled at random, which only needs a timestamp per key'''
+
+    def __init__(self, samples=EVICTION_SAMPLES):
+        '''Initialize an empty set of keys'''
+
+        self.samples = samples
+        # keys and their last use, with each key's position in the lists
+        self.keys = []
+        self.stamps = []
+        self.positions = {}
+        self.clock = 0
+
+
+    def add(self, key):
+        '''Track a new key as just used'''
+
+        self.positions[key] = len(self.keys)
+        self.keys.append(key)
+        self.stamps.append(self.clock)
+        self.clock += 1
+
+
+    def touch(self, key):
+        '''Mark a key as just used'''
+
+        self.stamps[self.positions[key]] = self.clock
+        self.clock += 1
+
+
+    def discard(self, key):
+        '''Stop tracking a removed key by moving the last key into its place'''
+
+        i = self.positions.pop(key, None)
+        if i is None:
+            return
+
+        last = self.keys.pop()
+        stamp = self.stamps.pop()
+        if (i < len(self.keys)):
+            self.keys[i] = last
+            self.stamps[i] = stamp
+            self.positions[last] = i
+
+
+    def victim(self):
+        '''Return the key to evict'''
+
+        count = len(self.keys)
+        sample = [random.randrange(count) for _ in range(min(self.samples, count))]
+
+        return self.keys[min(sample, key=self.stamps.__getitem__)]
+
+
+POLICIES = {
+    "lru": LRUPolicy,
+    "lfu": LFUPolicy,
+    "sampled-lru": SampledLRUPolicy
+}
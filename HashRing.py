@@ -0,0 +1,112 @@
+# HashRing.py
+# Author: Kristen Friday
+# Date: October 18, 2026
+
+# Consistent hashing for placing keys on the servers of a cluster. Every
+# server is hashed to a number of points (virtual nodes) on a ring of
+# 32-bit hashes; a key belongs to the server of the first point at or after
+# the key's hash, and its replicas to the next distinct servers around the
+# ring. Adding or removing a server only moves the keys on the arcs its
+# points take over or give up, about 1/N of them, and having many points
+# per server evens out how much of the ring each one owns. Keys are placed
+# by their CRC-32 (as for the shards of HashTableServer's workers), which
+# costs a fraction of a cryptographic hash. The points are only computed
+# when the ring changes, so they use BLAKE2: the CRC-32s of names that only
+# differ in a digit bunch up on the ring.
+
+import bisect
+import hashlib
+import zlib
+
+
+# points on the ring per server
+VNODES = 100
+
+
+def hash_of(key):
+    '''Return the position of a key on the ring'''
+
+    return zlib.crc32(key.encode('utf-8'))
+
+
+def point_of(node, i):
+    '''Return the position of the i-th point of a node on the ring'''
+
+    digest = hashlib.blake2b(f'{node}#{i}'.encode('utf-8'), digest_size=4).digest()
+
+    return int.from_bytes(digest, 'little')
+
+
+class HashRing:
+
+    '''A ring of servers (nodes) with vnodes points each'''
+
+    def __init__(self, nodes=(), vnodes=VNODES):
+        '''Initialize a ring with the given nodes'''
+
+        self.vnodes = vnodes
+        self.nodes = list(nodes)
+        self.build()
+
+
+    def build(self):
+        '''Place the points of every node on the ring, in order'''
+
+        points = sorted((point_of(node, i), node)
+                for node in self.nodes for i in range(self.vnodes))
+
+        self.points = [point for point, _ in points]
+        self.owners = [node for _, node in points]
+        # distinct nodes following each point, filled in as keys are placed
+        self.successors = {}
+
+
+    def add(self, node):
+        '''Add a node to the ring'''
+
+        if node not in self.nodes:
+            self.nodes.append(node)
+            self.build()
+
+
+    def remove(self, node):
+        '''Take a node off the ring'''
+
+        if node in self.nodes:
+            self.nodes.remove(node)
+            self.build()
+
+
+    def index_of(self, key):
+        '''Return the index of the first point at or after a key's hash'''
+
+        i = bisect.bisect_left(self.points, hash_of(key))
+
+        return i if i < len(self.points) else 0
+
+
+    def node_of(self, key):
+        '''Return the node a key is placed on'''
+
+        return self.owners[self.index_of(key)]
+
+
+    def nodes_of(self, key, count):
+        '''Return the node a key is placed on and the nodes holding its
+        other count - 1 replicas'''
+
+        i = self.index_of(key)
+
+        nodes = self.successors.get((i, count))
+        if nodes is None:
+            nodes = []
+            wanted = min(count, len(self.nodes))
+            j = i
+            while (len(nodes) < wanted):
+                if self.owners[j] not in nodes:
+                    nodes.append(self.owners[j])
+                j = (j + 1) % len(self.owners)
+            nodes = tuple(nodes)
+            self.successors[(i, count)] = nodes
+
+        return nodes
@@ -10,48 +10,388 @@
 
 
 import re
+import sys
+import json
+import time
+import heapq
+import itertools
+import ScanIndex
+import CompactStore
+import Eviction
+
+
+# scan_page examines at most this many keys per requested match, so that a
+# page of a scan with few matches still takes bounded time
+SCAN_EXAMINE = 16
+# marks a key that is not present (stored values may be None)
+MISSING = object()
+# expiry time of keys that do not expire
+FOREVER = float('inf')
+# the heap of expiry times is rebuilt once it holds this many entries more
+# than twice the number of expiring keys (entries of keys whose expiry
+# changed are left in the heap until they reach the top)
+EXPIRY_SLACK = 1024
 
 
 class HashTable:
 
     '''An implementation of a Hash Table with the 4 operations listed above'''
 
-    def __init__(self):
-        '''Intialize HashTable with an underlying dictionary data member'''
-        self.dictionary = {}
+    def __init__(self, trigrams=False, engine="dict"):
+        '''Intialize HashTable with an underlying dictionary data member and
+        the indexes used by scan (see ScanIndex). With the "compact" engine
+        the dictionary is a CompactStore, which only holds bytes values.'''
+        if (engine == "compact"):
+            self.dictionary = CompactStore.CompactStore()
+            self.index = ScanIndex.ScanIndex(trigrams, packed=True)
+        else:
+            self.dictionary = {}
+            self.index = ScanIndex.ScanIndex(trigrams)
+        self.engine = engine
         self.num_trxns = 0
         self.trxn_fh = None
+        # memory held by the stored keys and values themselves
+        self.key_bytes = 0
+        self.value_bytes = 0
+
+        # bounds on the size of the table when it is used as a cache, and
+        # the policy choosing what to evict (None without bounds)
+        self.eviction = None
+        self.policy = None
+        self.max_keys = None
+        self.max_memory = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # expiry times (seconds since the epoch) of the keys that expire,
+        # and a heap of (expiry time, key) to find the next ones due
+        self.expires = {}
+        self.expiry_heap = []
+        self.expired = 0
+
+        # versions of the keys that were written more than once; a present
+        # key is at version 1 when it is not here, and a missing key at 0
+        self.versions = {}
+
+
+    def set_eviction(self, policy, max_keys=None, max_memory=None):
+        '''Bound the number of keys and/or the memory of the stored keys and
+        values, evicting keys chosen by the named policy (see Eviction)'''
+
+        self.eviction = policy
+        self.max_keys = max_keys
+        self.max_memory = max_memory
+        self.policy = None
+        if (max_keys or max_memory):
+            self.policy = Eviction.POLICIES[policy]()
+            for key in self.dictionary:
+                self.policy.add(key)
+
+
+    def set_expiry(self, key, expires):
+        '''Make a key expire at the given time, or never if it is None'''
+
+        if expires is None:
+            self.expires.pop(key, None)
+            return
+
+        self.expires[key] = expires
+        heapq.heappush(self.expiry_heap, (expires, key))
+
+        if (len(self.expiry_heap) > 2 * len(self.expires) + EXPIRY_SLACK):
+            self.expiry_heap = [(t, k) for k, t in self.expires.items()]
+            heapq.heapify(self.expiry_heap)
+
+
+    def expire_if_due(self, key, now=None):
+        '''Remove a key if its expiry time has passed; return whether it did'''
+
+        expires = self.expires.get(key)
+        if (expires is None or expires > (time.time() if now is None else now)):
+            return False
+
+        self.drop(key)
+        self.expired += 1
+
+        return True
+
+
+    def expire(self, limit, now=None):
+        '''Remove keys whose expiry time has passed, looking at no more than
+        limit entries of the expiry heap; return the number removed'''
+
+        now = time.time() if now is None else now
+        heap = self.expiry_heap
+        removed = 0
+
+        for _ in range(limit):
+            if not heap or heap[0][0] > now:
+                break
+            expires, key = heapq.heappop(heap)
+            if (self.expires.get(key) == expires):
+                self.drop(key)
+                removed += 1
+
+        self.expired += removed
+
+        return removed
+
+
+    def next_expiry(self):
+        '''Return the earliest expiry time in the heap, or None'''
+
+        return self.expiry_heap[0][0] if self.expiry_heap else None
+
 
+    def insert(self, key, value, expires=None):
+        '''Insert a (key, value) pair into dictionary; the key expires at the
+        given time, or never if it is None'''
 
-    def insert(self, key, value):
-        '''Insert a (key, value) pair into dictionary'''
+        old = self.dictionary.get(key, MISSING)
+        if old is MISSING:
+            self.index.add(key)
+            self.key_bytes += sys.getsizeof(key)
+            if self.policy:
+                self.policy.add(key)
+        else:
+            self.value_bytes -= sys.getsizeof(old)
+            self.versions[key] = self.versions.get(key, 1) + 1
+            if self.policy:
+                self.policy.touch(key)
 
         self.dictionary[key] = value
+        self.value_bytes += sys.getsizeof(value)
+        if (expires is not None or self.expires):
+            self.set_expiry(key, expires)
         res = f'Inserted {key}'
         
         return res
 
+
+    def load(self, items, expires=None, versions=None):
+        '''Bulk insert (key, value) pairs, e.g. when restoring a checkpoint,
+        with the expiry times of the keys that expire and the versions of
+        the keys written more than once'''
+
+        self.dictionary.update(items)
+        for key, when in (expires or {}).items():
+            if key in self.dictionary:
+                self.set_expiry(key, when)
+        for key, version in (versions or {}).items():
+            if key in self.dictionary:
+                self.versions[key] = version
+        self.key_bytes = sum(map(sys.getsizeof, self.dictionary))
+        self.value_bytes = sum(map(sys.getsizeof, self.dictionary.values()))
+        self.index.rebuild(self.dictionary)
+
+        if self.policy:
+            self.set_eviction(self.eviction, self.max_keys, self.max_memory)
+
     
+    def mput(self, items, expires=None):
+        '''Insert every (key, value) pair of a dictionary, expiring at the
+        given time or never'''
+
+        for key, value in items.items():
+            self.insert(key, value, expires)
+
+        return len(items)
+
+
+    def mget(self, keys):
+        '''Returns a dictionary of the given keys that are present and
+        their values'''
+
+        if self.expires:
+            now = time.time()
+            for key in keys:
+                self.expire_if_due(key, now)
+
+        found = {key: self.dictionary[key] for key in keys if key in self.dictionary}
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        if self.policy:
+            for key in found:
+                self.policy.touch(key)
+
+        return found
+
+
+    def mremove(self, keys):
+        '''Removes the given keys that are present and returns them with
+        their values'''
+
+        removed = {}
+        for key in keys:
+            if (key in self.dictionary and not self.expire_if_due(key)):
+                removed[key] = self.drop(key)
+
+        return removed
+
+
     def lookup(self, key):
         '''Returns the value associated with a given key'''
 
+        if (self.expires and self.expire_if_due(key)):
+            self.misses += 1
+            return 'KeyError'
+
         try:
             value = self.dictionary[key]
-            return value
         except KeyError:
+            self.misses += 1
             return 'KeyError'
 
+        self.hits += 1
+        if self.policy:
+            self.policy.touch(key)
+
+        return value
+
     
+    def version(self, key):
+        '''Returns the version of a key: 0 if it is missing, and one more
+        for every write since it was inserted'''
+
+        if (self.expires and self.expire_if_due(key)):
+            return 0
+
+        if key not in self.dictionary:
+            return 0
+
+        return self.versions.get(key, 1)
+
+
+    def current(self, key, default):
+        '''Returns the decoded value of a key, or default if it is missing'''
+
+        if self.expires:
+            self.expire_if_due(key)
+
+        value = self.dictionary.get(key, MISSING)
+        if value is MISSING:
+            return default
+
+        return json.loads(value)
+
+
+    def incr(self, key, amount=1):
+        '''Adds amount to the integer value of a key (0 if it is missing)
+        and returns the new value'''
+
+        number = self.current(key, 0)
+        if (type(number) != int):
+            return 'TypeError'
+
+        number += amount
+        self.insert(key, json.dumps(number).encode('utf-8'), self.expires.get(key))
+
+        return number
+
+
+    def append(self, key, item):
+        '''Appends an item to the list value of a key (an empty list if it is
+        missing), or a string to its string value, and returns the new
+        length'''
+
+        value = self.current(key, [])
+        if (type(value) == list):
+            value.append(item)
+        elif (type(value) == str and type(item) == str):
+            value += item
+        else:
+            return 'TypeError'
+
+        self.insert(key, json.dumps(value).encode('utf-8'), self.expires.get(key))
+
+        return len(value)
+
+
+    def cas(self, key, version, value):
+        '''Sets the (encoded) value of a key only if it is at the given
+        version (0 to insert a missing key); returns whether it did and the
+        version of the key afterwards'''
+
+        current = self.version(key)
+        if (current != version):
+            return {"swapped": False, "version": current}
+
+        self.insert(key, value, self.expires.get(key))
+
+        return {"swapped": True, "version": self.versions.get(key, 1)}
+
+
+    def set_version(self, key, version):
+        '''Sets the version of a present key, e.g. to the version the same
+        key has on another replica'''
+
+        if key not in self.dictionary:
+            return
+
+        if (version > 1):
+            self.versions[key] = version
+        else:
+            self.versions.pop(key, None)
+
+
     def remove(self, key):
         '''Removes the key and associated value from the hash table and
         returns value to the caller'''
 
+        if (self.expires and self.expire_if_due(key)):
+            return 'KeyError'
+
+        return self.drop(key)
+
+
+    def drop(self, key):
+        '''Removes a key and its value, whether or not it has expired, and
+        returns the value'''
+
         try:
             value = self.dictionary.pop(key)
-            return value
         except KeyError:
             return 'KeyError'
 
+        self.key_bytes -= sys.getsizeof(key)
+        self.value_bytes -= sys.getsizeof(value)
+        self.index.discard(key)
+        if self.policy:
+            self.policy.discard(key)
+        self.expires.pop(key, None)
+        self.versions.pop(key, None)
+
+        return value
+
+
+    def over_limit(self):
+        '''Return whether the table holds more keys or memory than allowed'''
+
+        if (self.max_keys and len(self.dictionary) > self.max_keys):
+            return True
+
+        return bool(self.max_memory and self.key_bytes + self.value_bytes > self.max_memory)
+
+
+    def evict(self):
+        '''Remove the keys chosen by the eviction policy until the table is
+        within its limits again, and return them'''
+
+        evicted = []
+        if not self.policy:
+            return evicted
+
+        while (self.dictionary and self.over_limit()):
+            key = self.policy.victim()
+            self.drop(key)
+            evicted.append(key)
+
+        self.evictions += len(evicted)
+
+        return evicted
+
     
     def scan(self, reg_string):
         '''Returns a list of (key, value) pairs where the key matches
@@ -59,10 +399,57 @@ class HashTable:
 
         matches = []
         try:
-            regex = re.compile(reg_string)
+            regex, prefix, literals = ScanIndex.plan(reg_string)
         except re.error as err:
             return 're.error'
-        matches = [(k, v) for k, v in self.dictionary.items() if regex.search(k)]
+
+        # only the keys the index cannot rule out are matched; expired keys
+        # are skipped here and left for expire()
+        now = time.time()
+        expires = self.expires
+        keys = self.index.candidates(prefix, literals)
+        if keys is None:
+            matches = [(k, v) for k, v in self.dictionary.items()
+                    if regex.search(k) and expires.get(k, FOREVER) > now]
+        else:
+            matches = [(k, self.dictionary[k]) for k in keys
+                    if regex.search(k) and expires.get(k, FOREVER) > now]
 
         return matches
 
+
+    def scan_page(self, reg_string, cursor=None, limit=100):
+        '''Returns up to limit (key, value) pairs, in key order after the
+        cursor key, where the key matches the given regular expression, and
+        the cursor to pass to get the next page (None once it is done)'''
+
+        try:
+            regex, prefix, literals = ScanIndex.plan(reg_string)
+        except re.error as err:
+            return 're.error'
+
+        matches = []
+        examined = 0
+        now = time.time()
+        expires = self.expires
+        for k in self.index.ordered_candidates(prefix, literals, cursor):
+            if (regex.search(k) and expires.get(k, FOREVER) > now):
+                matches.append((k, self.dictionary[k]))
+
+            examined += 1
+            if (len(matches) >= limit or examined >= limit * SCAN_EXAMINE):
+                return matches, k
+
+        return matches, None
+
+
+    def range(self, start=None, end=None, limit=100, reverse=False):
+        '''Returns up to limit (key, value) pairs with start <= key < end in
+        key order, or in reverse order; a missing bound is unbounded'''
+
+        now = time.time()
+        expires = self.expires
+        keys = (k for k in self.index.keys.irange(start, end, reverse)
+                if expires.get(k, FOREVER) > now)
+
+        return [(k, self.dictionary[k]) for k in itertools.islice(keys, limit)]
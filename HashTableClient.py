@@ -12,90 +12,319 @@ import json
 import time
 import http.client
 import re
+import weakref
+import BinaryProtocol
 
 
-BYTES = 1024
+BYTES = 65536
+# number of requests kept in flight on one socket by pipeline()
+PIPELINE_DEPTH = 64
 NAME_HOST = 'catalog.cse.nd.edu:9097'
 
 
 class HashTableClient:
 
-    def __init__(self):
-        '''Constructore for HashTableClient'''
+    def __init__(self, pool=None, binary=False):
+        '''Constructore for HashTableClient; with binary set, new connections
+        ask the server for the binary protocol and use JSON if it refuses'''
 
         self.server = None
+        self.pool = pool
+        self.binary = binary
+        # bytes received past the end of the last response, per socket
+        self.recv_bufs = weakref.WeakKeyDictionary()
+        # sockets that speak the binary protocol, and the last request id
+        self.binary_socks = weakref.WeakKeyDictionary()
+        self.req_id = 0
 
 
-    def connect_to_server(self, host, port):
-        '''Return a socket that connects client to host and port'''
+    def connect_to_server(self, host, port, timeout=None):
+        '''Return a socket that connects client to host and port; with a
+        timeout, connecting and every later send or receive on the socket
+        give up after that many seconds'''
 
         for res in socket.getaddrinfo(host, port, socket.AF_UNSPEC, 
                 socket.SOCK_STREAM, 0, socket.AI_PASSIVE):
             family, sock_type, _, _, sockaddr = res
             client_socket = socket.socket(family, sock_type)
-            # throw error if request doesn't process in 30 seconds
+            # throw error if request doesn't process in timeout seconds
+            client_socket.settimeout(timeout)
             client_socket.connect(sockaddr)
             return client_socket
 
 
-    def process_request(self, sock, message):
-        '''Send request to server and receive response back'''
-       
+    def acquire_connection(self, host, port, timeout=None):
+        '''Return a connection to host and port, reusing a pooled one if
+        possible; the second value says whether the connection was reused.
+        The connection gives up on a request after timeout seconds.'''
+
+        if self.pool:
+            sock = self.pool.acquire(host, port)
+            if sock:
+                sock.settimeout(timeout)
+                return sock, True
+
+        sock = self.connect_to_server(host, port, timeout)
+        if self.binary:
+            try:
+                self.negotiate(sock)
+            except BaseException:
+                sock.close()
+                raise
+
+        return sock, False
+
+
+    def negotiate(self, sock):
+        '''Ask the server to speak the binary protocol on a new connection;
+        return whether it agreed. An older server answers the greeting with a
+        JSON error, which is read and dropped, and the socket stays JSON.'''
+
+        hello = BinaryProtocol.HELLO
+        sock.sendall(hello)
+
+        buf = self.recv_bufs.setdefault(sock, bytearray())
+        while (len(buf) < len(hello) and buf[:1] in (b"", hello[:1])):
+            data = sock.recv(BYTES)
+            if not data:
+                raise ConnectionResetError
+            buf += data
+
+        if (buf[:len(hello)] == hello):
+            del buf[:len(hello)]
+            self.binary_socks[sock] = True
+            return True
+
+        self.read_response(sock)
+        return False
+
+
+    def release_connection(self, host, port, sock):
+        '''Hand a connection back to the pool after a completed request'''
+
+        if self.pool:
+            self.pool.release(host, port, sock)
+        else:
+            sock.close()
+
+
+    def discard_connection(self, sock):
+        '''Close a connection that is no longer usable'''
+
+        self.recv_bufs.pop(sock, None)
+        self.binary_socks.pop(sock, None)
+        if self.pool:
+            self.pool.discard(sock)
+        else:
+            sock.close()
+
+
+    def encode_request(self, message, sock=None):
+        '''Package a request as a length-prefixed JSON message, or as a
+        binary one if sock speaks the binary protocol'''
+
+        if sock in self.binary_socks:
+            self.req_id = (self.req_id + 1) & 0xFFFFFFFF
+            return BinaryProtocol.encode_request(message, self.req_id)
+
         try:
-           req_info = json.dumps(message)
+            req_info = json.dumps(message).encode('utf-8')
         except ValueError as err:
             raise ValueError
 
-        request = (str(len(req_info)) + "," + req_info).encode('utf-8')
+        return str(len(req_info)).encode('utf-8') + b"," + req_info
+
+
+    def read_response(self, sock):
+        '''Read exactly one response from sock; bytes that belong to later
+        responses stay buffered for the next call'''
+
+        buf = self.recv_bufs.setdefault(sock, bytearray())
+
+        if sock in self.binary_socks:
+            return self.read_binary(sock, buf)
+
+        comma = buf.find(b',')
+        while comma < 0:
+            data = sock.recv(BYTES)
+            if not data:
+                raise ConnectionResetError
+            buf += data
+            comma = buf.find(b',')
+
+        end = comma + 1 + int(buf[:comma])
+        while len(buf) < end:
+            data = sock.recv(BYTES)
+            if not data:
+                raise ConnectionResetError
+            buf += data
+
+        res = buf[comma + 1:end]
+        del buf[:end]
+
+        return json.loads(res)
+
+
+    def read_binary(self, sock, buf):
+        '''Read exactly one binary response from sock into buf'''
+
+        while True:
+            for status, _, _, value in BinaryProtocol.frames(buf):
+                return BinaryProtocol.decode_response(status, value)
+
+            data = sock.recv(BYTES)
+            if not data:
+                raise ConnectionResetError
+            buf += data
+
+
+    def check_response(self, res_json):
+        '''Raise the exception matching an error reported by the server'''
+
+        if ("error" in res_json):
+            err = res_json["error"]
+            if err == 'TypeError':
+                raise TypeError
+            elif err == 'KeyError':
+                raise KeyError
+            elif err == 're.error':
+                raise re.error('invalid regular expression')
+            else:
+                print(err)
+
+        return res_json
+
+
+    def process_request(self, sock, message):
+        '''Send request to server and receive response back'''
+
+        self.send_request(sock, message)
+
+        return self.receive_response(sock)
+
+
+    def send_request(self, sock, message):
+        '''Send a request to the server without waiting for its response'''
+
+        request = self.encode_request(message, sock)
 
         try:
             sock.sendall(request)
-            data = sock.recv(BYTES).decode('utf-8')
-            res_bytes, res = data.split(',', 1)
-            while int(res_bytes) > len(res):
-                res += sock.recv(BYTES).decode('utf-8')
-
-            res_json = json.loads(res)
-            if ("error" in res_json):
-                err = res_json["error"]
-                if err == 'TypeError':
-                    raise TypeError
-                elif err == 'KeyError':
-                    raise KeyError
-                elif err == 're.error':
-                    raise re.error
-                else:
-                    print(err)
-
-            return res_json
+        except socket.error:
+            self.recv_bufs.pop(sock, None)
+            raise
+
 
+    def receive_response(self, sock):
+        '''Receive the response to the request sent last on sock. After a
+        socket.timeout, the part read so far stays buffered, so that the
+        response can still be waited for.'''
+
+        try:
+            res_json = self.read_response(sock)
+        except socket.timeout:
+            raise
         except socket.error:
+            self.recv_bufs.pop(sock, None)
+            raise
+
+        return self.check_response(res_json)
+
+
+    def pipeline(self, sock, messages, depth=PIPELINE_DEPTH):
+        '''Send several requests over one socket, keeping up to depth of them
+        in flight, and return their responses in order. Errors reported by
+        the server are left in the responses rather than raised.'''
+
+        requests = [self.encode_request(message, sock) for message in messages]
+        responses = []
+
+        try:
+            sent = 0
+            while len(responses) < len(requests):
+                # top up the window, then wait for the oldest response
+                window = min(len(requests), len(responses) + depth)
+                if (sent < window):
+                    sock.sendall(b"".join(requests[sent:window]))
+                    sent = window
+                responses.append(self.read_response(sock))
+        except socket.error:
+            self.recv_bufs.pop(sock, None)
             raise socket.error
 
+        return responses
+
 
-    def insert(self, key, value, socket):
-        '''Client stub to support insert operations'''
+    def insert(self, key, value, socket, ttl=None):
+        '''Client stub to support insert operations; with a ttl the key
+        expires after that many seconds'''
 
         message = {
             "method": "insert",
             "key": key,
             "value": value
         }
+        if ttl is not None:
+            message["ttl"] = ttl
 
         return self.process_request(socket, message)
 
 
-    def lookup(self, key, socket):
-        '''Client stub to support lookup operations'''
+    def lookup(self, key, socket, version=False):
+        '''Client stub to support lookup operations; with version the result
+        is the value along with the key's version, for use with cas'''
 
         message = {
             "method": "lookup",
             "key": key,
         }
+        if version:
+            message["version"] = True
         
         return self.process_request(socket, message)
 
 
+    def incr(self, key, socket, amount=1):
+        '''Client stub to add amount to the integer value of a key (0 if it
+        is missing) on the server; the result is the new value'''
+
+        message = {
+            "method": "incr",
+            "key": key,
+            "amount": amount
+        }
+
+        return self.process_request(socket, message)
+
+
+    def append(self, key, value, socket):
+        '''Client stub to append a value to the list (or string) value of a
+        key on the server; the result is the new length'''
+
+        message = {
+            "method": "append",
+            "key": key,
+            "value": value
+        }
+
+        return self.process_request(socket, message)
+
+
+    def cas(self, key, version, value, socket):
+        '''Client stub to set the value of a key only if it is still at the
+        given version (0 if it must not exist yet); the result tells whether
+        it was swapped and the key's version afterwards'''
+
+        message = {
+            "method": "cas",
+            "key": key,
+            "version": version,
+            "value": value
+        }
+
+        return self.process_request(socket, message)
+
+
     def remove(self, key, socket):
         '''Client stub to support remove operations'''
 
@@ -107,14 +336,83 @@ class HashTableClient:
         return self.process_request(socket, message)
 
 
-    def scan(self, regex, socket):
-        '''Client stub to support scan operations'''
+    def scan(self, regex, socket, cursor=None, limit=None):
+        '''Client stub to support scan operations; with a limit, the result
+        is one page of matches after cursor and the cursor of the next page'''
 
         message = {
             "method": "scan",
             "regex": regex,
         }
-        
+
+        if (limit is not None):
+            message["cursor"] = cursor
+            message["limit"] = limit
+
+        return self.process_request(socket, message)
+
+
+    def range(self, start, end, socket, limit=100, reverse=False):
+        '''Client stub for range queries: up to limit (key, value) pairs with
+        start <= key < end, in key order or in reverse; None is unbounded'''
+
+        message = {
+            "method": "range",
+            "start": start,
+            "end": end,
+            "limit": limit,
+            "reverse": reverse
+        }
+
+        return self.process_request(socket, message)
+
+
+    def mget(self, keys, socket):
+        '''Client stub to look up a list of keys in one request; the result
+        maps each key that is present to its value'''
+
+        message = {
+            "method": "mget",
+            "keys": keys
+        }
+
+        return self.process_request(socket, message)
+
+
+    def mput(self, items, socket, ttl=None):
+        '''Client stub to insert a dictionary of keys and values in one
+        request, logged and synced by the server as a single transaction;
+        with a ttl the keys expire after that many seconds'''
+
+        message = {
+            "method": "mput",
+            "items": items
+        }
+        if ttl is not None:
+            message["ttl"] = ttl
+
+        return self.process_request(socket, message)
+
+
+    def mremove(self, keys, socket):
+        '''Client stub to remove a list of keys in one request; the result
+        maps each key that was present to its value'''
+
+        message = {
+            "method": "mremove",
+            "keys": keys
+        }
+
+        return self.process_request(socket, message)
+
+
+    def stats(self, socket):
+        '''Client stub to request the server's counters'''
+
+        message = {
+            "method": "stats"
+        }
+
         return self.process_request(socket, message)
 
 
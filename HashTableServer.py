@@ -10,22 +10,345 @@
 
 import sys
 import socket
+import errno
 import json
 import HashTable
+import Checkpoint
+import Eviction
+import Migration
+import BinaryProtocol
 import os
-import select
+import selectors
 import time
 import re
+import argparse
+import collections
+import traceback
+import zlib
+import signal
+import heapq
+import itertools
+import functools
+import HashRing
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 
 # host is all available interfaces
 HOST = None
-BYTES = 1024
+BYTES = 65536
+# longest length prefix accepted in front of a request
+MAX_PREFIX = 20
+# stop reading requests from a client once this many response bytes are
+# waiting to be sent to it, and resume once they drop to the low-water mark
+OUTPUT_HIGH_WATER = 4 * 1024 * 1024
+OUTPUT_LOW_WATER = 1024 * 1024
 TRXN_LOG = "table.txn"
 CHECK_FILE = "table.ckpt"
-MAX_TRXNS = 100
+# checkpoint once the log holds CHECKPOINT_BYTES bytes or once the oldest
+# transaction not in a checkpoint is CHECKPOINT_INTERVAL seconds old
+CHECKPOINT_BYTES = 64 * 1024 * 1024
+CHECKPOINT_INTERVAL = 300
+# how often (seconds) the server checks whether a checkpoint has finished
+CHECKPOINT_POLL = 1
+# group commit: sync the log once per pass of the select loop, or once the
+# oldest unsynced transaction is GROUP_COMMIT_WINDOW ms old, or once
+# GROUP_COMMIT_RECORDS transactions are waiting, whichever comes first
+GROUP_COMMIT_WINDOW = 0
+GROUP_COMMIT_RECORDS = 256
+DURABILITY_MODES = ("always", "group", "interval", "off")
+STORAGE_ENGINES = ("dict", "compact")
+# suffixes accepted by --max-memory
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
 NAME_HOST = 'catalog.cse.nd.edu'
 NAME_PORT = 9097
+# with --workers N, worker i keeps its shard in its own checkpoint and log
+# and the number of workers the data was written with is kept in LAYOUT_FILE
+WORKER_TRXN_LOG = "table.w{shard}.txn"
+WORKER_CHECK_FILE = "table.w{shard}.ckpt"
+LAYOUT_FILE = "table.workers"
+# workers reach each other over TCP on the loopback interface
+PEER_HOST = '127.0.0.1'
+# default and largest number of items in one page of a paged scan or in
+# the result of a range query
+SCAN_PAGE = 100
+MAX_SCAN_PAGE = 10000
+# stop reading from a client with this many responses still outstanding
+MAX_OUTSTANDING = 1024
+# most entries of the expiry heap looked at per pass of the event loop, so
+# that many keys expiring at once do not stall clients
+EXPIRE_BATCH = 200
+# number of client hash rings kept for filtering routed scans
+RING_CACHE = 8
+# longest wait (seconds) between steps of a running migration, and before
+# trying again to reach a server it could not reach
+MIGRATE_TICK = 0.01
+MIGRATE_RETRY = 1
+# seconds another server has to accept a migration connection, which is
+# made without blocking the event loop
+MIGRATE_CONNECT_TIMEOUT = 2
+# how often (seconds) a worker checks that its parent is still running
+PARENT_POLL = 5
+# a successful response relayed from another worker starts with this
+SUCCESS_PREFIX = b'{"status": "Success", "result": '
+# single-key methods are answered by the worker owning the key; other
+# methods are sent to every worker and their results merged
+KEY_METHODS = ("insert", "lookup", "remove", "incr", "append", "cas", "replicate")
+WORKER_FAILURE = b'{"status": "Failure", "error": "worker unavailable"}'
+
+
+class ClientConnection:
+
+    '''A connected client: its non-blocking socket, the bytes received from
+    it that do not make up a complete request yet, and the responses that
+    could not be written to it yet'''
+
+    def __init__(self, sock, addr):
+        '''Initialize a connection with empty receive and send buffers'''
+
+        self.sock = sock
+        self.addr = addr
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        self.events = selectors.EVENT_READ
+        self.paused = False
+        self.closed = False
+        # responses that must be sent in order but are not all known yet
+        self.replies = collections.deque()
+        # "json" or "binary", chosen by the first bytes the client sends,
+        # and the id of the binary request being answered
+        self.protocol = None
+        self.req_id = 0
+
+
+    def frames(self):
+        '''Yield the payload of every complete length-prefixed request in the
+        receive buffer, removing it from the buffer; a malformed length prefix
+        yields None and discards the rest of the buffer, since the start of
+        the next request can no longer be found'''
+
+        while self.inbuf:
+            comma = self.inbuf.find(b',', 0, MAX_PREFIX + 1)
+            if (comma < 0):
+                if (len(self.inbuf) > MAX_PREFIX):
+                    self.inbuf.clear()
+                    yield None
+                return
+
+            prefix = self.inbuf[:comma]
+            if not prefix.isdigit():
+                self.inbuf.clear()
+                yield None
+                return
+
+            end = comma + 1 + int(prefix)
+            if (len(self.inbuf) < end):
+                return
+
+            payload = self.inbuf[comma + 1:end]
+            del self.inbuf[:end]
+
+            yield payload
+
+
+class PeerConnection(ClientConnection):
+
+    '''A connection from one worker to another; responses arrive in the
+    order the requests were sent and are handed to the queued callbacks'''
+
+    def __init__(self, sock, shard, addr=None):
+        '''Initialize a connection to the worker owning shard, or to another
+        server (named by shard) at addr'''
+
+        super().__init__(sock, addr or (PEER_HOST, shard))
+        self.shard = shard
+        self.protocol = "json"
+        self.callbacks = collections.deque()
+        # set while the connection is being made, with the time (monotonic)
+        # by which it has to be made, if any; requests wait in outbuf
+        self.connecting = False
+        self.connect_by = None
+
+
+class Reply:
+
+    '''A slot in a client's ordered reply queue, filled in once the response
+    is known (after a group commit, or once another worker has answered)'''
+
+    def __init__(self, conn):
+        '''Initialize an empty reply for a client connection'''
+
+        self.conn = conn
+        self.req_id = conn.req_id
+        self.data = None
+
+
+class Gather:
+
+    '''Collects the partial responses of a request that was split across
+    workers and merges them into the response for the client'''
+
+    def __init__(self, reply, parts, merge):
+        '''Initialize a gather of parts responses for reply'''
+
+        self.reply = reply
+        self.parts = [None] * parts
+        self.missing = parts
+        self.merge = merge
+
+
+    def finish(self):
+        '''Return the merged response, or the first error of any part'''
+
+        for part in self.parts:
+            if "error" in part:
+                return part
+
+        return {
+            "status": "Success",
+            "result": self.merge([part["result"] for part in self.parts])
+        }
+
+
+def merge_scan(results, req=None):
+    '''Merge the scan results of all workers. A page of a paged scan ends at
+    the smallest cursor any worker stopped at, since only the matches up to
+    that key are known to be complete, and holds no more than the page's
+    limit; the rest are found again by the next page.'''
+
+    if not (results and isinstance(results[0], dict)):
+        return [item for result in results for item in result]
+
+    cursors = [result["cursor"] for result in results if result["cursor"] is not None]
+    cursor = min(cursors) if cursors else None
+
+    items = sorted((item for result in results for item in result["items"]),
+            key=lambda item: item[0])
+    if cursor is not None:
+        items = [item for item in items if item[0] <= cursor]
+
+    limit = min(req.get("limit", SCAN_PAGE), MAX_SCAN_PAGE) if req else len(items)
+    if (len(items) > limit):
+        items = items[:limit]
+        cursor = items[-1][0]
+
+    return {"items": items, "cursor": cursor}
+
+
+def merge_stats(results):
+    '''Merge the counters of all workers: sizes and totals are added up,
+    maximums and peaks take the largest value'''
+
+    merged = {}
+    for stats in results:
+        for name, value in stats.items():
+            if ("max" in name or "peak" in name):
+                merged[name] = max(merged.get(name, value), value)
+            else:
+                merged[name] = merged.get(name, 0) + value
+    merged["workers"] = len(results)
+
+    return merged
+
+
+def merge_migration(results):
+    '''Merge the migration progress of all workers: counters are added up,
+    and the phase is that of the worker furthest behind'''
+
+    merged = merge_stats([{name: value for name, value in result.items()
+            if name not in ("phase", "elapsed")} for result in results])
+    merged["phase"] = min((result["phase"] for result in results),
+            key=Migration.PHASES.index)
+    merged["elapsed"] = max(result["elapsed"] for result in results)
+
+    return merged
+
+
+def merge_range(results, req):
+    '''Merge the range results of all workers, each already in order, and
+    keep the first limit items'''
+
+    reverse = bool(req.get("reverse"))
+    limit = min(req.get("limit", SCAN_PAGE), MAX_SCAN_PAGE)
+    items = heapq.merge(*results, key=lambda item: item[0], reverse=reverse)
+
+    return list(itertools.islice(items, limit))
+
+
+def merge_mapping(results):
+    '''Merge the key to value results of all workers'''
+
+    merged = {}
+    for result in results:
+        merged.update(result)
+
+    return merged
+
+
+# methods sent to every worker, with the function merging their results
+FAN_OUT_METHODS = {
+    "scan": merge_scan,
+    "stats": merge_stats,
+    "migrate": merge_migration
+}
+
+# batch methods split by the worker owning each key, with the function
+# merging the results of the parts
+BATCH_METHODS = {
+    "mget": merge_mapping,
+    "mput": sum,
+    "mremove": merge_mapping,
+    "import": sum
+}
+
+
+def encode_frame(payload):
+    '''Prefix a JSON payload with its length'''
+
+    return str(len(payload)).encode('utf-8') + b"," + payload
+
+
+def encode_json(obj):
+    '''Return the JSON encoding of a response or log record as bytes; stored
+    values are kept as the bytes of their JSON encoding (see execute) and
+    are spliced in as they are instead of being decoded and encoded again'''
+
+    if isinstance(obj, bytes):
+        return obj
+    if isinstance(obj, (list, tuple)):
+        return b"[" + b", ".join([encode_json(item) for item in obj]) + b"]"
+    if isinstance(obj, dict):
+        return b"{" + b", ".join([json.dumps(str(key)).encode('utf-8') + b": " +
+            encode_json(value) for key, value in obj.items()]) + b"}"
+
+    return json.dumps(obj).encode('utf-8')
+
+
+def valid_key(key):
+    '''Return whether a key is a string that can be stored; JSON strings may
+    hold lone surrogates, which have no UTF-8 encoding'''
+
+    if (type(key) != str):
+        return False
+    if key.isascii():
+        return True
+
+    try:
+        key.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+
+    return True
+
+
+@functools.lru_cache(maxsize=RING_CACHE)
+def ring_of(nodes, vnodes):
+    '''Return the consistent hashing ring a ClusterClient places keys with'''
+
+    return HashRing.HashRing(nodes, vnodes)
 
 
 class HashTableServer:
@@ -34,29 +357,126 @@ class HashTableServer:
         '''Initialize a server object with a hash table in memory'''
 
         self.hash_table = HashTable.HashTable()
-        self.client_socks = {}
+        self.selector = selectors.DefaultSelector()
+        self.listeners = []
+        self.connections = {}
+        # connections whose ordered replies may have become ready to send
+        self.touched = set()
+
+        # sharding across worker processes
+        self.workers = 1
+        self.shard = 0
+        self.peer_ports = []
+        self.peers = {}
+        self.trxn_log = TRXN_LOG
+        self.check_file = CHECK_FILE
+
+        # output backpressure
+        self.high_water = OUTPUT_HIGH_WATER
+        self.low_water = OUTPUT_LOW_WATER
+        self.peak_queued = 0
+        self.pauses = 0
+
+        # transactions written to the log but not yet synced, and the
+        # responses that may only be sent once they are
+        self.group_size = 0
+        self.group_start = None
+        self.pending = []
+        self.set_durability("group")
+
+        # transaction log segments and background checkpoints
+        self.segment = 0
+        self.log_bytes = 0
+        self.ckpt_bytes = CHECKPOINT_BYTES
+        self.ckpt_interval = CHECKPOINT_INTERVAL
+        self.ckpt_time = time.monotonic()
+        self.ckpt_pid = None
+        self.ckpt_segment = None
+        # checkpoints written and failed, reported by stats
+        self.checkpoints = 0
+        self.ckpt_failures = 0
+
+        # the migration of keys to other servers while the cluster grows
+        self.migration = None
 
 
     def process_cml_args(self):
-        '''Process command line arguments (port number)'''
-
-        if (len(sys.argv) < 2):
-            print('Usage: HashTableServer.py [PROJECT]')
-            return None
-
-        return sys.argv[1]
+        '''Process command line arguments (project name and options)'''
+
+        parser = argparse.ArgumentParser(prog='HashTableServer.py')
+        parser.add_argument('project')
+        parser.add_argument('--durability', default='group', type=parse_durability,
+            help='always, group, interval=MS or off (default: group)')
+        parser.add_argument('--checkpoint-bytes', type=int, default=CHECKPOINT_BYTES,
+            help='checkpoint once the log reaches this many bytes')
+        parser.add_argument('--checkpoint-interval', type=float, default=CHECKPOINT_INTERVAL,
+            help='checkpoint at least this often (seconds) while writes arrive')
+        parser.add_argument('--workers', type=int, default=1,
+            help='number of worker processes, each owning a shard of the keys')
+        parser.add_argument('--trigram-index', action='store_true',
+            help='index key trigrams to speed up scans for literal substrings')
+        parser.add_argument('--engine', choices=STORAGE_ENGINES, default='dict',
+            help='storage engine: dict, or compact to use less memory per key')
+        parser.add_argument('--max-keys', type=int, default=None,
+            help='evict keys to hold at most this many (split across workers)')
+        parser.add_argument('--max-memory', type=parse_size, default=None,
+            help='evict keys to keep stored keys and values under this size, '
+                 'e.g. 512M (split across workers)')
+        parser.add_argument('--eviction', choices=Eviction.POLICIES, default='lru',
+            help='which keys to evict: lru, lfu or sampled-lru (default: lru)')
+        args = parser.parse_args()
+
+        if (args.workers < 1):
+            parser.error('--workers must be at least 1')
+        self.workers = args.workers
+
+        self.hash_table = HashTable.HashTable(args.trigram_index, args.engine)
+        self.hash_table.set_eviction(args.eviction, args.max_keys, args.max_memory)
+        self.set_durability(*args.durability)
+        self.ckpt_bytes = args.checkpoint_bytes
+        self.ckpt_interval = args.checkpoint_interval
+
+        return args.project
+
+
+    def set_durability(self, mode, interval=0):
+        '''Choose when the transaction log is synced and when writes are
+        acknowledged:
+          always      - sync every transaction before acknowledging it
+          group       - sync once per group commit before acknowledging
+          interval=MS - acknowledge at once, sync at most MS ms later
+          off         - acknowledge at once, never sync'''
+
+        self.durability = mode
+        self.hold_acks = mode in ("always", "group")
+        self.sync_log = mode != "off"
+
+        if (mode == "always"):
+            self.group_window = 0
+            self.group_records = 1
+        elif (mode == "group"):
+            self.group_window = GROUP_COMMIT_WINDOW / 1000
+            self.group_records = GROUP_COMMIT_RECORDS
+        elif (mode == "interval"):
+            self.group_window = interval / 1000
+            self.group_records = sys.maxsize
+        else:
+            self.group_window = 0
+            self.group_records = sys.maxsize
 
 
-    def create_TCP_connection(self):
+    def create_TCP_connection(self, port=0, reuse_port=False):
         '''Create a TCP connection on specified port; return the socket'''
 
-        for res in socket.getaddrinfo(HOST, 0, socket.AF_UNSPEC, socket.SOCK_STREAM,
+        for res in socket.getaddrinfo(HOST, port, socket.AF_UNSPEC, socket.SOCK_STREAM,
                 0, socket.AI_PASSIVE):
             family, sock_type, _, _, sockaddr = res
 
             serv_socket = socket.socket(family, sock_type)
+            if reuse_port:
+                serv_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             serv_socket.bind(sockaddr)
-            serv_socket.listen()
+            serv_socket.listen(socket.SOMAXCONN)
 
             print(f'Server: Listening on port {serv_socket.getsockname()[1]}')
 
@@ -65,11 +485,8 @@ class HashTableServer:
 
     def form_response(self, res_info):
         '''Package together a response to send back to client given a json object'''
-        
-        response = json.dumps(res_info)
-        response = (str(len(response)) + "," + response).encode('utf-8')
 
-        return response
+        return encode_frame(encode_json(res_info))
 
 
     def respond_with_failure(self, err, status="Failure"):
@@ -83,189 +500,1492 @@ class HashTableServer:
         return self.form_response(res)
 
 
+    def encode_reply(self, client_conn, res, req_id):
+        '''Package a response dictionary in the protocol the client speaks'''
+
+        if (client_conn.protocol == "binary"):
+            return BinaryProtocol.encode_response(res, req_id, encode_json)
+
+        return self.form_response(res)
+
+
     def call_req_op(self, req):
-        '''Invoke the correct hash table operation based on request'''
+        '''Invoke the correct hash table operation based on request and
+        return the response to send back'''
+
+        res = {
+            "status": "Success",
+            "result": self.execute(req)
+        }
+
+        return self.form_response(res)
+
+
+    def run_request(self, req):
+        '''Invoke a request and return its response as a dictionary, with
+        invalid requests reported in the response instead of raised'''
+
+        try:
+            result = self.execute(req)
+        except KeyError:
+            return {"status": "Invalid Request", "error": "KeyError"}
+        except TypeError:
+            return {"status": "Invalid Request", "error": "TypeError"}
+        except re.error:
+            return {"status": "Invalid Request", "error": "re.error"}
+
+        return {"status": "Success", "result": result}
+
+
+    def execute(self, req):
+        '''Invoke the correct hash table operation and return its result'''
 
         method = req["method"]
 
         if (method == "insert"):
-            if (type(req["key"]) != str):
-                raise TypeError
-        
-            try:
-                json_str = json.dumps(req["value"])
-                json.loads(json_str)
-            except json.decoder.JSONDecodeError:
-                raise TypeError
+            self.check_key(req["key"])
 
-            result = self.hash_table.insert(req["key"], req["value"])
+            value = self.encode_value(req["value"])
+            expires = self.expiry_of(req)
 
-            # add to transaction log
-            self.add_transaction(req)
+            result = self.hash_table.insert(req["key"], value, expires)
+
+            # add to transaction log, with the time the key expires rather
+            # than its TTL so that replaying it gives the same expiry; other
+            # fields of the request are left out
+            trxn = {"method": "insert", "key": req["key"], "value": value}
+            if expires is not None:
+                trxn["expires"] = expires
+            self.add_transaction(trxn)
+            self.evict()
         elif (method == "lookup"):
-            if (type(req["key"]) != str):
-                raise TypeError
+            self.check_key(req["key"])
             result = self.hash_table.lookup(req["key"])
+            if (req.get("version") and result != "KeyError"):
+                result = {"value": result, "version": self.hash_table.version(req["key"])}
+        elif (method in ("incr", "append", "cas")):
+            result = self.read_modify_write(req)
+        elif (method == "replicate"):
+            result = self.replicate(req)
         elif (method == "remove"):
-            if (type(req["key"]) != str):
-                raise TypeError
+            self.check_key(req["key"])
             result = self.hash_table.remove(req["key"])
+            if self.migration:
+                self.migration.note_removed([req["key"]])
             
             # add to transaction log
             self.add_transaction(req)
         elif (method == "scan"):
             if (type(req["regex"]) != str):
                 raise TypeError
-            result = self.hash_table.scan(req["regex"])
+            if ("cursor" in req or "limit" in req):
+                result = self.scan_page(req)
+            else:
+                result = self.hash_table.scan(req["regex"])
+            if ("partition" in req and result != "re.error"):
+                result = self.keep_partition(result, req["partition"])
+        elif (method == "range"):
+            result = self.range(req)
+        elif (method == "mget"):
+            result = self.hash_table.mget(self.check_keys(req["keys"]))
+        elif (method == "mput"):
+            items = req["items"]
+            if (type(items) != dict):
+                raise TypeError
+            self.check_keys(list(items))
+            items = {key: self.encode_value(value) for key, value in items.items()}
+            expires = self.expiry_of(req)
+            result = self.hash_table.mput(items, expires)
+
+            # the whole batch is a single transaction
+            if items:
+                trxn = {"method": "mput", "items": items}
+                if expires is not None:
+                    trxn["expires"] = expires
+                self.add_transaction(trxn)
+                self.evict()
+        elif (method == "mremove"):
+            result = self.hash_table.mremove(self.check_keys(req["keys"]))
+            if self.migration:
+                self.migration.note_removed(req["keys"])
+
+            if result:
+                self.add_transaction({"method": "mremove", "keys": list(result)})
+        elif (method == "import"):
+            result = self.import_keys(req)
+        elif (method == "migrate"):
+            result = self.migrate(req)
+        elif (method == "stats"):
+            result = self.stats()
         else:
             raise KeyError
         
         if (result == "KeyError"):
             raise KeyError
+        elif (result == "TypeError"):
+            raise TypeError
         elif (result == "re.error"):
-            raise re.error
+            raise re.error("invalid regular expression")
 
-        res = {
-            "status": "Success",
-            "result": result
-        }
+        return result
 
-        # create new checkpoint file after MAX_TRXNS entries
-        if (self.hash_table.num_trxns > MAX_TRXNS):
-            self.compact_trxns()
 
-        return self.form_response(res)
+    def read_modify_write(self, req):
+        '''Apply an incr, append or cas request to its key atomically; the
+        new value is logged as a single insert that keeps the key's expiry
+        time, so that replaying it does not depend on the old value'''
+
+        key = self.check_key(req["key"])
+
+        method = req["method"]
+        if (method == "incr"):
+            amount = req.get("amount", 1)
+            if (type(amount) != int):
+                raise TypeError
+            result = self.hash_table.incr(key, amount)
+        elif (method == "append"):
+            result = self.hash_table.append(key, req["value"])
+        else:
+            version = req["version"]
+            if (type(version) != int):
+                raise TypeError
+            value = self.encode_value(req["value"])
+            result = self.hash_table.cas(key, version, value)
+            if not result["swapped"]:
+                return result
+
+        if (result == "TypeError"):
+            return result
+
+        trxn = {"method": "insert", "key": key, "value": self.hash_table.dictionary[key]}
+        expires = self.hash_table.expires.get(key)
+        if expires is not None:
+            trxn["expires"] = expires
+        self.add_transaction(trxn)
+        self.evict()
+
+        return result
+
+
+    def replicate(self, req):
+        '''Set a key to the value and version a cas left it at on another
+        replica, keeping the key's expiry time, so that the replicas agree
+        on its version whatever version it was at here; the result is the
+        version'''
+
+        key = self.check_key(req["key"])
+        version = req["version"]
+        if (type(version) != int or version < 1):
+            raise TypeError
+
+        value = self.encode_value(req["value"])
+        if self.hash_table.expires:
+            self.hash_table.expire_if_due(key)
+        expires = self.hash_table.expires.get(key)
+
+        self.hash_table.insert(key, value, expires)
+        self.hash_table.set_version(key, version)
+
+        trxn = {"method": "replicate", "key": key, "value": value, "version": version}
+        if expires is not None:
+            trxn["expires"] = expires
+        self.add_transaction(trxn)
+        self.evict()
+
+        return version
+
+
+    def expiry_of(self, req):
+        '''Replace the optional TTL (seconds) of a write request with the
+        time its keys expire, and return that time (None without a TTL)'''
+
+        ttl = req.pop("ttl", None)
+        req.pop("expires", None)
+        if ttl is None:
+            return None
+
+        if (type(ttl) not in (int, float) or not ttl > 0):
+            raise TypeError
+
+        req["expires"] = time.time() + ttl
+
+        return req["expires"]
+
+
+    def evict(self):
+        '''Evict keys while the table is over its limits; the evictions are
+        logged, so that recovery ends up with the same keys'''
+
+        evicted = self.hash_table.evict()
+        if evicted:
+            self.add_transaction({"method": "evict", "keys": evicted})
+
+
+    def migrate(self, req):
+        '''Start streaming the keys this server is the primary of to the
+        servers that hold them once the cluster has grown, report how far
+        that got, or finish it by dropping the keys it no longer holds (once
+        every server has streamed its keys); the result is the progress'''
+
+        action = req.get("action")
+
+        if (action == "start"):
+            if (self.migration and self.migration.phase != Migration.DONE):
+                raise TypeError
+            self.migration = self.start_migration(req)
+            print(f'Server: Migrating {len(self.migration.keys)} keys')
+        elif (action == "finish"):
+            if not self.migration:
+                raise KeyError
+            if (self.migration.phase == Migration.STREAMING):
+                raise TypeError
+            if (self.migration.phase == Migration.STREAMED):
+                self.migration.begin_drop(list(self.hash_table.dictionary))
+        elif (action != "status"):
+            raise TypeError
+
+        if not self.migration:
+            raise KeyError
+
+        return self.migration.progress()
+
+
+    def start_migration(self, req):
+        '''Return a new migration of a snapshot of the keys, as described by
+        a migrate request'''
+
+        name = req.get("name")
+        old_nodes = req.get("old_nodes")
+        nodes = req.get("nodes")
+        vnodes = req.get("vnodes")
+        replicas = req.get("replicas")
+        servers = req.get("servers")
+        rate = req.get("rate", Migration.MIGRATE_RATE)
+        batch = req.get("batch", Migration.MIGRATE_BATCH)
+
+        for ring in (old_nodes, nodes):
+            if (type(ring) != list or not ring or any(type(node) != str for node in ring)):
+                raise TypeError
+        if (type(name) != str or type(servers) != dict):
+            raise TypeError
+        if (type(vnodes) != int or vnodes < 1 or type(replicas) != int or replicas < 1):
+            raise TypeError
+        if (type(rate) not in (int, float) or rate < 0 or type(batch) != int or batch < 1):
+            raise TypeError
+
+        addrs = {}
+        for node in nodes:
+            addr = servers.get(node)
+            if (node == name):
+                continue
+            if (type(addr) != list or len(addr) != 2 or type(addr[0]) != str or type(addr[1]) != int):
+                raise TypeError
+            addrs[node] = tuple(addr)
+
+        return Migration.Migration(name, old_nodes, nodes, vnodes, replicas, addrs,
+            list(self.hash_table.dictionary), rate, batch)
+
+
+    def import_keys(self, req):
+        '''Insert the keys another server streams to this one while the
+        cluster grows, at the versions they had there; a key that was
+        written or removed here since the migration started is newer than
+        the streamed copy and is kept as it is. The result is the number of
+        keys inserted.'''
+
+        items = req["items"]
+        expires = req.get("expires", {})
+        versions = req.get("versions", {})
+        if (type(items) != dict or type(expires) != dict or type(versions) != dict):
+            raise TypeError
+        self.check_keys(list(items))
+        if any(type(expiry) not in (int, float) for expiry in expires.values()):
+            raise TypeError
+        if any(type(version) != int or version < 1 for version in versions.values()):
+            raise TypeError
+
+        removed = self.migration.removed if self.migration else ()
+        inserted = {}
+        for key, value in items.items():
+            if (self.hash_table.version(key) or key in removed):
+                continue
+            inserted[key] = self.encode_value(value)
+            self.hash_table.insert(key, inserted[key], expires.get(key))
+            if (key in versions):
+                self.hash_table.set_version(key, versions[key])
+
+        if inserted:
+            self.add_transaction({"method": "import", "items": inserted,
+                "expires": {key: expires[key] for key in inserted if key in expires},
+                "versions": {key: versions[key] for key in inserted if key in versions}})
+            self.evict()
+
+        return len(inserted)
+
+
+    def encode_value(self, value):
+        '''Return the JSON encoding of a value to insert. Values are stored
+        encoded so that lookups, scans, checkpoints and the log use their
+        bytes as they are; a decoded JSON value is never bytes, so bytes
+        were already validated (and freed of line breaks, which would split
+        a log record) by the protocol.'''
+
+        if isinstance(value, bytes):
+            return value
+
+        try:
+            return json.dumps(value).encode('utf-8')
+        except (TypeError, ValueError):
+            raise TypeError
+
+
+    def scan_page(self, req):
+        '''Return one page of a paged scan: the matches after the cursor key
+        (from the start if it is null), and the cursor of the next page,
+        which is null once the scan is complete'''
+
+        cursor = req.get("cursor")
+        limit = req.get("limit", SCAN_PAGE)
+        if (cursor is not None and not valid_key(cursor)):
+            raise TypeError
+        if (type(limit) != int or limit < 1):
+            raise TypeError
+
+        page = self.hash_table.scan_page(req["regex"], cursor, min(limit, MAX_SCAN_PAGE))
+        if (page == "re.error"):
+            return page
+
+        items, cursor = page
+
+        return {"items": items, "cursor": cursor}
+
+
+    def keep_partition(self, result, partition):
+        '''Keep only the matches of a scan (or of a page of one) whose keys
+        are placed on the owner server by the ring of the given nodes, so
+        that a client reading each key from one replica is not sent the
+        keys it gets from the others'''
+
+        if (type(partition) != dict):
+            raise TypeError
+
+        nodes = partition.get("nodes")
+        vnodes = partition.get("vnodes")
+        owner = partition.get("owner")
+        if (type(nodes) != list or not nodes or any(type(node) != str for node in nodes)):
+            raise TypeError
+        if (type(vnodes) != int or vnodes < 1 or type(owner) != str):
+            raise TypeError
+
+        ring = ring_of(tuple(nodes), vnodes)
+        if (type(result) == dict):
+            items = [item for item in result["items"] if ring.node_of(item[0]) == owner]
+            return {"items": items, "cursor": result["cursor"]}
+
+        return [item for item in result if ring.node_of(item[0]) == owner]
+
+
+    def range(self, req):
+        '''Return up to limit (key, value) pairs with start <= key < end in
+        key order, or in reverse order if reverse is true; a null start or
+        end leaves that side of the range open'''
+
+        start = req.get("start")
+        end = req.get("end")
+        limit = req.get("limit", SCAN_PAGE)
+        reverse = req.get("reverse", False)
+
+        for bound in (start, end):
+            if (bound is not None and not valid_key(bound)):
+                raise TypeError
+        if (type(limit) != int or limit < 1 or type(reverse) != bool):
+            raise TypeError
+
+        return self.hash_table.range(start, end, min(limit, MAX_SCAN_PAGE), reverse)
+
+
+    def check_key(self, key):
+        '''Make sure the key of a request can be stored (see valid_key)'''
+
+        if not valid_key(key):
+            raise TypeError
+
+        return key
+
+
+    def check_keys(self, keys):
+        '''Make sure the keys of a batch request are a list of keys that can
+        be stored'''
+
+        if (type(keys) != list or not all(valid_key(key) for key in keys)):
+            raise TypeError
+
+        return keys
+
+
+    def send_response(self, client_conn, response):
+        '''Queue a response to be written to the client. It is held back
+        while the transaction group it may depend on has not been synced,
+        and it waits behind earlier responses that are not known yet.'''
+
+        if (self.group_size and self.hold_acks):
+            reply = self.new_reply(client_conn)
+            self.pending.append((self.complete, (reply, response)))
+        elif client_conn.replies:
+            reply = self.new_reply(client_conn)
+            reply.data = response
+        else:
+            client_conn.outbuf += response
+
+
+    def new_reply(self, client_conn):
+        '''Reserve the next slot in a client's ordered reply queue'''
+
+        reply = Reply(client_conn)
+        client_conn.replies.append(reply)
+
+        return reply
+
+
+    def complete(self, reply, response):
+        '''Fill in a reserved reply; it is sent by the next flush_touched'''
+
+        reply.data = response
+        self.touched.add(reply.conn)
+
+
+    def flush_touched(self):
+        '''Move the replies that are ready, in order, to the output of every
+        connection that was touched, and write them out'''
+
+        touched, self.touched = self.touched, set()
+        for conn in touched:
+            replies = conn.replies
+            while replies and replies[0].data is not None:
+                conn.outbuf += replies.popleft().data
+
+            if not self.write_client(conn):
+                self.close_client(conn)
 
 
     def decode_request(self, client_conn):
-        '''Decode a request sent by client'''
+        '''Read from a client and answer every complete request it has sent
+        so far, in order; return False once the client has disconnected'''
 
         # wait for client requests
         try:
-            data = client_conn.recv(BYTES).decode('utf-8')
+            data = client_conn.sock.recv(BYTES)
+        except (BlockingIOError, InterruptedError):
+            return True
         except ConnectionResetError:
-            print(f"Server: ConnectionResetError {client_conn.getsockname()}")
+            print(f"Server: ConnectionResetError {client_conn.addr}")
             return False
 
         # break if no more requests
         if not data:
             return False
 
-        try:
-            # split data received at first comma to get total bytes
-            total_bytes, req = data.split(',',1)
-            total_bytes = int(total_bytes)
-        except ValueError:
-            client_conn.sendall(self.respond_with_failure(ValueError, "Invalid Request"))
+        client_conn.inbuf += data
+        self.process_requests(client_conn)
+
+        return self.write_client(client_conn)
+
+
+    def process_requests(self, client_conn):
+        '''Answer the complete requests in a client's receive buffer, unless
+        too much output for that client is already waiting to be sent'''
+
+        if client_conn.paused:
+            return
+
+        if (client_conn.protocol is None and not self.negotiate(client_conn)):
+            return
+
+        if (client_conn.protocol == "binary"):
+            frames = BinaryProtocol.frames(client_conn.inbuf)
+        else:
+            frames = client_conn.frames()
+
+        for req in frames:
+            if (client_conn.protocol == "binary"):
+                self.handle_binary(client_conn, *req)
+            else:
+                self.handle_request(client_conn, req)
+
+            if (self.group_size >= self.group_records):
+                self.commit_transactions()
+
+            # leave the remaining requests buffered until the client reads
+            if (len(client_conn.outbuf) >= self.high_water or
+                    len(client_conn.replies) >= MAX_OUTSTANDING):
+                client_conn.paused = True
+                self.pauses += 1
+                break
+
+
+    def negotiate(self, client_conn):
+        '''Choose the protocol of a new connection from its first bytes: a
+        client opening with BinaryProtocol.HELLO is answered with the same
+        HELLO and speaks the binary protocol, anything else is JSON. Return
+        False while too few bytes have arrived to tell.'''
+
+        hello = BinaryProtocol.HELLO
+        inbuf = client_conn.inbuf
+
+        if (inbuf[:1] != hello[:1]):
+            client_conn.protocol = "json"
+            return True
+
+        if (len(inbuf) < len(hello)):
+            return False
+
+        # an unknown version is answered as an invalid JSON request, which
+        # tells the client to fall back to JSON like an older server would
+        if (inbuf[:len(hello)] == hello):
+            del inbuf[:len(hello)]
+            client_conn.outbuf += hello
+            client_conn.protocol = "binary"
+        else:
+            client_conn.protocol = "json"
+
+        return True
+
+
+    def write_client(self, client_conn):
+        '''Write as much queued output to a client as its socket accepts
+        without blocking, and wait for writability if any is left over;
+        return False if the connection has failed'''
+
+        if client_conn.closed:
+            return False
+
+        # requests to a peer wait until its connection is made
+        if (isinstance(client_conn, PeerConnection) and client_conn.connecting):
             return True
 
-        # ensure that all data packets are received in request
-        while total_bytes > len(req):
-            req += client_conn.recv(BYTES).decode('utf-8')
-     
+        self.peak_queued = max(self.peak_queued, len(client_conn.outbuf))
+
+        try:
+            while client_conn.outbuf:
+                sent = client_conn.sock.send(client_conn.outbuf)
+                del client_conn.outbuf[:sent]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except socket.error:
+            return False
+
+        if (client_conn.paused and len(client_conn.outbuf) <= self.low_water and
+                len(client_conn.replies) < MAX_OUTSTANDING // 2):
+            client_conn.paused = False
+            self.process_requests(client_conn)
+
+        # a paused client is not read from until its output drains
+        events = 0 if client_conn.paused else selectors.EVENT_READ
+        if client_conn.outbuf:
+            events |= selectors.EVENT_WRITE
+
+        if (events != client_conn.events):
+            if not client_conn.events:
+                self.selector.register(client_conn.sock, events, client_conn)
+            elif not events:
+                self.selector.unregister(client_conn.sock)
+            else:
+                self.selector.modify(client_conn.sock, events, client_conn)
+            client_conn.events = events
+
+        return True
+
+
+    def accept_clients(self, serv_socket):
+        '''Accept every pending connection on a listening socket'''
+
+        while True:
+            try:
+                new_client, addr = serv_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as err:
+                # e.g. out of file descriptors; retry on the next wakeup
+                print(f'Server: Could not accept connection: {err}')
+                return
+
+            new_client.setblocking(False)
+            new_client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            client_conn = ClientConnection(new_client, addr)
+            self.connections[new_client] = client_conn
+            self.selector.register(new_client, selectors.EVENT_READ, client_conn)
+            print(f'Server: Client connected: {addr}')
+
+
+    def close_client(self, client_conn):
+        '''Forget a client connection and close its socket'''
+
+        if client_conn.closed:
+            return
+
+        client_conn.closed = True
+        self.connections.pop(client_conn.sock, None)
+        if client_conn.events:
+            self.selector.unregister(client_conn.sock)
+        client_conn.sock.close()
+        print(f'Server: Disconnecting {client_conn.addr}')
+
+        if isinstance(client_conn, PeerConnection):
+            self.fail_peer(client_conn)
+
+
+    def listen(self, serv_socket):
+        '''Start accepting clients on a listening socket'''
+
+        serv_socket.setblocking(False)
+        self.listeners.append(serv_socket)
+        self.selector.register(serv_socket, selectors.EVENT_READ, None)
+
+
+    def serve_once(self, timeout):
+        '''Run one pass of the event loop: wait up to timeout seconds, then
+        accept new clients, answer readable ones and flush writable ones'''
+
+        # wait sooner if an open transaction group has to be synced
+        events = self.selector.select(self.commit_timeout(timeout))
+
+        for key, mask in events:
+            if key.data is None:
+                self.accept_clients(key.fileobj)
+                continue
+
+            client_conn = key.data
+            if (isinstance(client_conn, PeerConnection) and client_conn.connecting):
+                if not self.finish_connect(client_conn):
+                    self.close_client(client_conn)
+                continue
+            if (mask & selectors.EVENT_READ):
+                if isinstance(client_conn, PeerConnection):
+                    alive = self.read_peer(client_conn)
+                else:
+                    alive = self.decode_request(client_conn)
+                if not alive:
+                    self.close_client(client_conn)
+                    continue
+            if (mask & selectors.EVENT_WRITE):
+                if not self.write_client(client_conn):
+                    self.close_client(client_conn)
+
+        self.pump_migration()
+        self.flush_touched()
+
+        # acknowledge this pass's writes once they are durable
+        if self.commit_due():
+            self.commit_transactions()
+
+        self.poll_checkpoint()
+
+        # expire a bounded number of keys whose time has come; the rest are
+        # expired on later passes, or when they are accessed
+        self.hash_table.expire(EXPIRE_BATCH)
+
+
+    def stats(self):
+        '''Return counters describing the state of the server'''
+
+        queued = [len(conn.outbuf) for conn in self.connections.values()]
+
+        stats = {
+            "keys": len(self.hash_table.dictionary),
+            "value_bytes": self.hash_table.value_bytes,
+            "connections": len(self.connections),
+            "output_queued_bytes": sum(queued),
+            "output_max_queued_bytes": max(queued, default=0),
+            "output_peak_queued_bytes": self.peak_queued,
+            "output_paused_connections": sum(conn.paused for conn in self.connections.values()),
+            "output_pauses": self.pauses
+        }
+        stats.update(self.hash_table.index.stats())
+        if (self.hash_table.engine == "compact"):
+            stats["engine_bytes"] = self.hash_table.dictionary.memory_bytes()
+
+        table = self.hash_table
+        stats.update({
+            "key_bytes": table.key_bytes,
+            "cache_hits": table.hits,
+            "cache_misses": table.misses,
+            "evictions": table.evictions,
+            "expiring_keys": len(table.expires),
+            "expired": table.expired
+        })
+        if table.policy:
+            stats["limit_keys"] = table.max_keys or 0
+            stats["limit_memory_bytes"] = table.max_memory or 0
+        if self.migration:
+            progress = self.migration.progress()
+            for name in ("examined", "sent", "bytes_sent", "failed", "dropped"):
+                stats[f"migrate_{name}"] = progress[name]
+
+        # a log that keeps growing means checkpoints are failing
+        stats.update({
+            "checkpoints": self.checkpoints,
+            "checkpoint_failures": self.ckpt_failures,
+            "log_segments": len(self.list_segments())
+        })
+
+        return stats
+
+
+    def handle_request(self, client_conn, req):
+        '''Decode a single request payload and answer it, or hand it to the
+        workers owning the keys it touches'''
+
+        if req is None:
+            self.send_response(client_conn,
+                self.respond_with_failure("ValueError", "Invalid Request"))
+            return
+
         try:
             json_data = json.loads(req)
         except ValueError:
-            client_conn.sendall(self.respond_with_failure("ValueError",
-                "Invalid Request"))
+            self.send_response(client_conn,
+                self.respond_with_failure("ValueError", "Invalid Request"))
+            return
+
+        if (self.workers > 1 and self.route_request(client_conn, req, json_data)):
+            return
+
+        self.send_response(client_conn, self.form_response(self.run_request(json_data)))
+
+
+    def handle_binary(self, client_conn, opcode, req_id, key, value):
+        '''Decode a single binary request and answer it, or hand it to the
+        workers owning the keys it touches'''
+
+        client_conn.req_id = req_id
+
+        try:
+            req = BinaryProtocol.decode_request(opcode, key, value)
+        except ValueError:
+            res = {"status": "Invalid Request", "error": "ValueError"}
+            self.send_response(client_conn, self.encode_reply(client_conn, res, req_id))
+            return
+
+        if (self.workers > 1 and self.route_request(client_conn, None, req)):
+            return
+
+        res = self.run_request(req)
+        self.send_response(client_conn, self.encode_reply(client_conn, res, req_id))
+
+
+    def start_worker(self, shard, workers, peer_ports):
+        '''Set this process up as the worker owning one shard of the keys'''
+
+        # the selector of the parent process must not be shared
+        self.selector.close()
+        self.selector = selectors.DefaultSelector()
+
+        self.shard = shard
+        self.workers = workers
+        self.peer_ports = peer_ports
+
+        # each worker holds its share of the cache limits
+        table = self.hash_table
+        if table.policy:
+            max_keys = table.max_keys and max(1, table.max_keys // workers)
+            max_memory = table.max_memory and max(1, table.max_memory // workers)
+            table.set_eviction(table.eviction, max_keys, max_memory)
+        self.trxn_log = WORKER_TRXN_LOG.format(shard=shard)
+        self.check_file = WORKER_CHECK_FILE.format(shard=shard)
+
+
+    def shard_of(self, key):
+        '''Return the number of the worker owning a key'''
+
+        return zlib.crc32(key.encode('utf-8')) % self.workers
+
+
+    def route_request(self, client_conn, payload, req):
+        '''Forward a request owned by other workers, or send it to all of
+        them; return False if this worker answers it by itself. Workers talk
+        JSON to each other, so a binary request comes without a payload.'''
+
+        # requests already split up by another worker are answered locally
+        if (type(req) != dict or req.get("local")):
+            return False
+
+        method = req.get("method")
+        if (method in KEY_METHODS):
+            key = req.get("key")
+            # invalid keys are rejected by this worker
+            if (not valid_key(key) or self.shard_of(key) == self.shard):
+                return False
+
+            if payload is None:
+                payload = encode_json(req)
+            self.forward(client_conn, self.shard_of(key), payload)
             return True
 
+        if (method in FAN_OUT_METHODS):
+            part = dict(req, local=True)
+            parts = {shard: part for shard in range(self.workers)}
+            merge = FAN_OUT_METHODS[method]
+            if (method == "scan"):
+                merge = functools.partial(merge_scan, req=req)
+            self.scatter(client_conn, parts, merge)
+            return True
+
+        if (method == "range"):
+            part = dict(req, local=True)
+            parts = {shard: part for shard in range(self.workers)}
+            self.scatter(client_conn, parts, functools.partial(merge_range, req=req))
+            return True
+
+        if (method in BATCH_METHODS):
+            parts = self.split_batch(req)
+            # invalid batches are rejected here; local ones are run here
+            if (not parts or list(parts) == [self.shard]):
+                return False
+
+            self.scatter(client_conn, parts, BATCH_METHODS[method])
+            return True
+
+        return False
+
+
+    def split_batch(self, req):
+        '''Split a batch request into one request per worker owning some of
+        its keys; return None if the request is malformed'''
+
+        parts = {}
+
+        if (req["method"] in ("mput", "import")):
+            items = req.get("items")
+            expires = req.get("expires", {})
+            versions = req.get("versions", {})
+            if (type(items) != dict or type(expires) != dict or type(versions) != dict):
+                return None
+            if not all(valid_key(key) for key in items):
+                return None
+            for key, value in items.items():
+                part = parts.setdefault(self.shard_of(key),
+                    {"method": req["method"], "items": {}, "local": True})
+                part["items"][key] = value
+                if (key in expires):
+                    part.setdefault("expires", {})[key] = expires[key]
+                if (key in versions):
+                    part.setdefault("versions", {})[key] = versions[key]
+            if ("ttl" in req):
+                for part in parts.values():
+                    part["ttl"] = req["ttl"]
+        else:
+            keys = req.get("keys")
+            if (type(keys) != list or not all(valid_key(key) for key in keys)):
+                return None
+            for key in keys:
+                part = parts.setdefault(self.shard_of(key),
+                    {"method": req["method"], "keys": [], "local": True})
+                part["keys"].append(key)
+
+        return parts
+
+
+    def forward(self, client_conn, shard, payload):
+        '''Pass a request on to the worker owning its key; that worker's
+        response is relayed to the client unchanged'''
+
+        reply = self.new_reply(client_conn)
+
+        peer = self.peer_for(shard)
+        if not peer:
+            self.complete_forward(reply, WORKER_FAILURE)
+            return
+
+        peer.outbuf += encode_frame(payload)
+        peer.callbacks.append((self.complete_forward, (reply,)))
+        self.touched.add(peer)
+
+
+    def complete_forward(self, reply, payload):
+        '''Relay the response of another worker to the client'''
+
+        if (reply.conn.protocol == "binary"):
+            # the result of a success is already JSON; errors are decoded
+            if payload.startswith(SUCCESS_PREFIX):
+                result = bytes(payload[len(SUCCESS_PREFIX):-1])
+                res = {"status": "Success", "result": result}
+            else:
+                res = json.loads(payload)
+            self.complete(reply, self.encode_reply(reply.conn, res, reply.req_id))
+        else:
+            self.complete(reply, encode_frame(payload))
+
+
+    def scatter(self, client_conn, parts, merge):
+        '''Send one part of a request to each worker in parts (a dictionary
+        of worker number to request) and answer the client once the merged
+        response of all of them is known'''
+
+        reply = self.new_reply(client_conn)
+        gather = Gather(reply, len(parts), merge)
+
+        for index, (shard, req) in enumerate(parts.items()):
+            if (shard == self.shard):
+                # a local write is only part of the answer once it is synced
+                response = self.run_request(req)
+                if (self.group_size and self.hold_acks):
+                    self.pending.append((self.gather_part, (gather, index, response)))
+                else:
+                    self.gather_part(gather, index, response)
+                continue
+
+            peer = self.peer_for(shard)
+            if not peer:
+                self.gather_part(gather, index, json.loads(WORKER_FAILURE))
+                continue
+
+            peer.outbuf += encode_frame(encode_json(req))
+            peer.callbacks.append((self.gather_json, (gather, index)))
+            self.touched.add(peer)
+
+
+    def gather_json(self, gather, index, payload):
+        '''Record the response of another worker to its part of a request'''
+
+        self.gather_part(gather, index, json.loads(payload))
+
+
+    def gather_part(self, gather, index, response):
+        '''Record the response to one part of a split request, and answer the
+        client once every part has arrived'''
+
+        gather.parts[index] = response
+        gather.missing -= 1
+
+        if not gather.missing:
+            reply = gather.reply
+            self.complete(reply, self.encode_reply(reply.conn, gather.finish(), reply.req_id))
+
+
+    def peer_for(self, shard, addr=None, timeout=None):
+        '''Return the connection to another worker, or to another server
+        (named by shard) at addr, starting to connect if needed; requests
+        can be queued on it at once, and fail if it is not made within
+        timeout seconds (see expire_connects)'''
+
+        peer = self.peers.get(shard)
+        if peer:
+            return peer
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
         try:
-            client_conn.sendall(self.call_req_op(json_data))
-        except KeyError:
-            client_conn.sendall(self.respond_with_failure("KeyError",
-                "Invalid Request"))
-        except TypeError:
-            client_conn.sendall(self.respond_with_failure("TypeError",
-                "Invalid Request"))
+            err = sock.connect_ex(addr or (PEER_HOST, self.peer_ports[shard]))
+        except OSError as error:
+            err = error.errno
+        if (err not in (0, errno.EINPROGRESS)):
+            sock.close()
+            print(f'Server: Could not reach {"server" if addr else "worker"} {shard}: {os.strerror(err)}')
+            return None
+
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        peer = PeerConnection(sock, shard, addr)
+        self.peers[shard] = peer
+
+        # the socket turns writable once the connection is made (or failed)
+        if err:
+            peer.connecting = True
+            peer.events = selectors.EVENT_WRITE
+            if timeout:
+                peer.connect_by = time.monotonic() + timeout
+        self.selector.register(sock, peer.events, peer)
+
+        return peer
+
+
+    def finish_connect(self, peer):
+        '''Start using a peer connection once it was made, writing out the
+        requests queued on it; return False if it could not be made'''
+
+        err = peer.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            print(f'Server: Could not reach {peer.addr}: {os.strerror(err)}')
+            return False
+
+        peer.connecting = False
+        return self.write_client(peer)
+
+
+    def expire_connects(self):
+        '''Give up on peer connections that were not made in time, failing
+        the requests queued on them'''
+
+        now = time.monotonic()
+        for peer in list(self.peers.values()):
+            if (peer.connecting and peer.connect_by and peer.connect_by < now):
+                print(f'Server: Could not reach {peer.addr}: timed out')
+                self.close_client(peer)
+
+
+    def read_peer(self, peer):
+        '''Read responses from another worker and hand each of them to the
+        request waiting for it; return False once the connection is lost'''
+
+        try:
+            data = peer.sock.recv(BYTES)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except socket.error:
+            return False
+
+        if not data:
+            return False
+
+        peer.inbuf += data
+        for payload in peer.frames():
+            if payload is None:
+                return False
+
+            callback, args = peer.callbacks.popleft()
+            callback(*args, payload)
 
         return True
 
 
-    def dump_checkpoint(self):
-        '''Generate a checkpoint file for the current state of the hash map'''
+    def fail_peer(self, peer):
+        '''Fail every request still waiting on a lost worker connection'''
 
-        tmp_file = f'{CHECK_FILE}.tmp'
-        with open(tmp_file, "w") as fh:
-            for key, value in self.hash_table.dictionary.items():
-                json_data = {
-                    "key": key,
-                    "value": value
-                }
-                fh.write(json.dumps(json_data))
-                fh.write("\n")
+        if (self.peers.get(peer.shard) is peer):
+            del self.peers[peer.shard]
 
-            # flush and sync file to disk
-            fh.flush()
-            os.fsync(fh.fileno())
+        callbacks, peer.callbacks = peer.callbacks, collections.deque()
+        for callback, args in callbacks:
+            callback(*args, WORKER_FAILURE)
+
+
+    def pump_migration(self):
+        '''Take the next step of a running migration, as far as its rate
+        allows: stream the next keys of the snapshot to the servers that
+        now hold them, or drop the keys this server no longer holds'''
+
+        migration = self.migration
+        if not migration:
+            return
+
+        if (migration.phase == Migration.STREAMING):
+            self.expire_connects()
+            self.stream_keys(migration)
+        elif (migration.phase == Migration.DROPPING):
+            self.drop_moved(migration)
+
+
+    def stream_keys(self, migration):
+        '''Examine the next keys of the snapshot, and send every server that
+        has a full batch of keys queued (or the last one) that batch, unless
+        it has too many batches to acknowledge'''
+
+        if (migration.exhausted() and not migration.queued and not any(migration.inflight.values())):
+            migration.phase = Migration.STREAMED
+            print(f'Server: Streamed {migration.sent} keys in {migration.batches} batches')
+            return
+
+        # keys are only examined while no server is behind on its batches
+        if all(count < Migration.MAX_INFLIGHT for count in migration.inflight.values()):
+            migration.queue(migration.next_keys(migration.budget()))
+
+        now = time.monotonic()
+        for target in list(migration.queued):
+            keys = migration.take_batch(target, now)
+            if keys:
+                self.send_batch(migration, target, keys)
+
+
+    def send_batch(self, migration, target, keys):
+        '''Send the current values, expiry times and versions of some keys
+        to the server target in a single import request; keys that are gone
+        by now are left out'''
+
+        table = self.hash_table
+        items = {}
+        expires = {}
+        versions = {}
+        for key in keys:
+            if (table.expires and table.expire_if_due(key)) or key not in table.dictionary:
+                continue
+            items[key] = table.dictionary[key]
+            if key in table.expires:
+                expires[key] = table.expires[key]
+            if key in table.versions:
+                versions[key] = table.versions[key]
+
+        if not items:
+            return
+
+        peer = None
+        if (migration.backoff.get(target, 0) <= time.monotonic()):
+            peer = self.peer_for(target, migration.servers[target], MIGRATE_CONNECT_TIMEOUT)
+        if not peer:
+            migration.backoff[target] = time.monotonic() + MIGRATE_RETRY
+            migration.requeue(target, list(items))
+            return
+
+        frame = encode_frame(encode_json({"method": "import", "items": items,
+            "expires": expires, "versions": versions}))
+        peer.outbuf += frame
+        peer.callbacks.append((self.complete_batch, (migration, target, list(items))))
+        self.touched.add(peer)
+
+        migration.inflight[target] = migration.inflight.get(target, 0) + 1
+        migration.batches += 1
+        migration.bytes_sent += len(frame)
+
+
+    def complete_batch(self, migration, target, keys, payload):
+        '''Count the keys of an acknowledged batch as streamed, or send them
+        again later if it failed'''
+
+        migration.inflight[target] -= 1
+
+        if payload.startswith(SUCCESS_PREFIX):
+            migration.sent += len(keys)
+        else:
+            migration.backoff[target] = time.monotonic() + MIGRATE_RETRY
+            migration.requeue(target, keys)
+
+
+    def drop_moved(self, migration):
+        '''Remove the next keys of the snapshot that this server no longer
+        holds under the new placement'''
+
+        keys = [key for key in migration.next_keys(migration.budget()) if not migration.holds(key)]
+        if keys:
+            removed = self.hash_table.mremove(keys)
+            if removed:
+                self.add_transaction({"method": "mremove", "keys": list(removed)})
+                migration.dropped += len(removed)
+
+        if migration.exhausted():
+            migration.phase = Migration.DONE
+            migration.finished = time.time()
+            migration.removed = set()
+            print(f'Server: Dropped {migration.dropped} keys that moved')
+
+
+    def dump_checkpoint(self, segment):
+        '''Generate a checkpoint file for the current state of the hash map
+        that covers every transaction up to and including log segment'''
+
+        tmp_file = f'{self.check_file}.tmp'
+        items = self.hash_table.dictionary.items()
+        Checkpoint.write_checkpoint(tmp_file, items, segment, sync=self.sync_log,
+            expires=self.hash_table.expires, versions=self.hash_table.versions)
 
         # rename file to perform atomic writing of checkpoint file
-        os.rename(tmp_file, CHECK_FILE)
+        os.rename(tmp_file, self.check_file)
+
+        # make the rename itself durable before the log is deleted
+        if self.sync_log:
+            self.sync_directory()
+
+
+    def sync_directory(self):
+        '''Sync the directory holding the checkpoint and transaction log'''
+
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self.check_file)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+    def segment_path(self, segment):
+        '''Return the file name of a transaction log segment'''
+
+        return f'{self.trxn_log}.{segment}'
+
+
+    def list_segments(self):
+        '''Return the numbers of all transaction log segments on disk in order'''
+
+        log_dir = os.path.dirname(os.path.abspath(self.trxn_log))
+        prefix = os.path.basename(self.trxn_log) + "."
+
+        segments = []
+        for name in os.listdir(log_dir):
+            if name.startswith(prefix) and name[len(prefix):].isdigit():
+                segments.append(int(name[len(prefix):]))
+
+        return sorted(segments)
 
 
     def add_transaction(self, trxn):
         '''Add to transaction log for operations that alter the state of the table'''
 
-        if not os.path.exists(TRXN_LOG):
-            fh = open(TRXN_LOG, "w+")
-            fh.flush()
-            os.fsync(fh.fileno())
-            fh.close()
-            self.hash_table.trxn_fh = open(TRXN_LOG, "r+")
+        if not self.hash_table.trxn_fh:
+            self.hash_table.trxn_fh = open(self.segment_path(self.segment), "ab")
 
-        self.hash_table.trxn_fh.write(json.dumps(trxn))
-        self.hash_table.trxn_fh.write("\n")
-        
-        # flush and sync file to disk
-        self.hash_table.trxn_fh.flush()
-        os.fsync(self.hash_table.trxn_fh.fileno())
+        record = encode_json(trxn) + b"\n"
+        self.hash_table.trxn_fh.write(record)
+        self.log_bytes += len(record)
+
+        # the record is synced together with the rest of its group
+        if not self.group_size:
+            self.group_start = time.monotonic()
+        self.group_size += 1
 
         self.hash_table.num_trxns += 1
 
 
-    def compact_trxns(self):
-        '''Create a new checkpoint file after storing over 100 transactions'''
+    def commit_due(self):
+        '''Return whether the open transaction group has to be synced now'''
 
-        self.dump_checkpoint()
-        self.hash_table.num_trxns = 0
+        if not self.group_size:
+            return False
 
-        try:
+        return (self.group_size >= self.group_records or
+                time.monotonic() - self.group_start >= self.group_window)
+
+
+    def commit_timeout(self, timeout):
+        '''Shorten a select timeout so that an open group is synced in time,
+        a running checkpoint is noticed soon after it finishes and keys
+        are expired when their time comes'''
+
+        if self.ckpt_pid:
+            timeout = min(timeout, CHECKPOINT_POLL)
+
+        expiry = self.hash_table.next_expiry()
+        if expiry is not None:
+            timeout = max(0, min(timeout, expiry - time.time()))
+
+        if (self.migration and self.migration.phase in (Migration.STREAMING, Migration.DROPPING)):
+            timeout = min(timeout, MIGRATE_TICK)
+
+        if not self.group_size:
+            return timeout
+
+        remaining = self.group_start + self.group_window - time.monotonic()
+
+        return max(0, min(timeout, remaining))
+
+
+    def commit_transactions(self):
+        '''Sync the open group of transactions to disk with a single fsync,
+        then send every response that was held back waiting for it'''
+
+        if self.group_size:
+            # flush and sync file to disk
+            self.hash_table.trxn_fh.flush()
+            if self.sync_log:
+                os.fsync(self.hash_table.trxn_fh.fileno())
+
+            self.group_size = 0
+            self.group_start = None
+
+        pending, self.pending = self.pending, []
+        for callback, args in pending:
+            callback(*args)
+
+        self.flush_touched()
+
+
+    def checkpoint_due(self):
+        '''Return whether the log has grown large or old enough to checkpoint'''
+
+        if (self.ckpt_pid or not self.hash_table.num_trxns):
+            return False
+
+        return (self.log_bytes >= self.ckpt_bytes or
+                time.monotonic() - self.ckpt_time >= self.ckpt_interval)
+
+
+    def rotate_log(self):
+        '''Close the current log segment and start writing a new one;
+        return the number of the segment that was closed'''
+
+        # everything in the closed segment must be synced and acknowledged
+        self.commit_transactions()
+
+        if self.hash_table.trxn_fh:
+            self.hash_table.trxn_fh.close()
             self.hash_table.trxn_fh = None
-            os.remove(TRXN_LOG)
-        except OSError:
-            print("Unable to delete transaction file")
+
+        closed = self.segment
+        self.segment += 1
+        self.log_bytes = 0
+        self.hash_table.num_trxns = 0
+
+        return closed
+
+
+    def start_checkpoint(self):
+        '''Rotate the log and write a checkpoint of the closed segments in a
+        forked child, which works on a copy-on-write snapshot of the table
+        while this process keeps serving requests'''
+
+        segment = self.rotate_log()
+        self.ckpt_time = time.monotonic()
+
+        if not hasattr(os, "fork"):
+            try:
+                self.dump_checkpoint(segment)
+            except Exception as err:
+                print(f'Server: Checkpoint failed: {err}')
+                self.ckpt_failures += 1
+                return
+            self.checkpoints += 1
+            self.remove_segments(segment)
+            return
+
+        pid = os.fork()
+        if (pid == 0):
+            # the child must not hold client connections open
+            peers = [peer.sock for peer in self.peers.values()]
+            for sock in list(self.connections) + self.listeners + peers:
+                sock.close()
+
+            status = 0
+            try:
+                self.dump_checkpoint(segment)
+            except BaseException as err:
+                print(f'Server: Checkpoint failed: {err}')
+                status = 1
+            os._exit(status)
+
+        self.ckpt_pid = pid
+        self.ckpt_segment = segment
+        print(f'Server: Checkpointing up to log segment {segment}')
+
+
+    def poll_checkpoint(self):
+        '''Reap a finished background checkpoint, and start a new one if due'''
+
+        if self.ckpt_pid:
+            pid, status = os.waitpid(self.ckpt_pid, os.WNOHANG)
+            if (pid == 0):
+                return
+
+            self.ckpt_pid = None
+            if (os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0):
+                self.checkpoints += 1
+                self.remove_segments(self.ckpt_segment)
+            else:
+                # keep the log; its segments are replayed on the next try
+                self.ckpt_failures += 1
+                print(f'Server: Checkpoint up to segment {self.ckpt_segment} failed '
+                      f'({self.ckpt_failures} failures, {len(self.list_segments())} log segments kept)')
+
+        if self.checkpoint_due():
+            self.start_checkpoint()
+
+
+    def remove_segments(self, last):
+        '''Delete the log segments covered by the checkpoint'''
+
+        for segment in self.list_segments():
+            if (segment > last):
+                break
+            try:
+                os.remove(self.segment_path(segment))
+            except OSError:
+                print("Unable to delete transaction file")
+
+
+    def apply_transaction(self, trxn):
+        '''Apply a logged transaction directly to the hash table'''
+
+        method = trxn["method"]
+
+        if (method in ("insert", "replicate")):
+            value = json.dumps(trxn["value"]).encode('utf-8')
+            self.hash_table.insert(trxn["key"], value, trxn.get("expires"))
+            if (method == "replicate"):
+                self.hash_table.set_version(trxn["key"], trxn["version"])
+        elif (method == "remove"):
+            self.hash_table.remove(trxn["key"])
+        elif (method == "mput"):
+            self.hash_table.mput({key: json.dumps(value).encode('utf-8')
+                for key, value in trxn["items"].items()}, trxn.get("expires"))
+        elif (method in ("mremove", "evict")):
+            self.hash_table.mremove(trxn["keys"])
+        elif (method == "import"):
+            expires = trxn.get("expires", {})
+            versions = trxn.get("versions", {})
+            for key, value in trxn["items"].items():
+                self.hash_table.insert(key, json.dumps(value).encode('utf-8'), expires.get(key))
+                if (key in versions):
+                    self.hash_table.set_version(key, versions[key])
+        else:
+            raise ValueError(f'unknown logged method {method}')
+
+
+    def replay_segment(self, segment):
+        '''Apply every transaction of a log segment to the hash table without
+        validating or logging it again; a torn record at the end of the
+        segment (from a crash in the middle of a write) is cut off.
+        Return the number of transactions and bytes replayed.'''
+
+        path = self.segment_path(segment)
+        count = 0
+        offset = 0
+
+        with open(path, "rb+") as fh:
+            for line in fh:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete record")
+                    trxn = json.loads(line)
+                except ValueError:
+                    if fh.read(1):
+                        raise ValueError(f'{path}: corrupt record at byte {offset}')
+
+                    print(f'Server: Dropping torn record at end of {path}')
+                    fh.truncate(offset)
+                    break
+
+                self.apply_transaction(trxn)
+                offset += len(line)
+                count += 1
+
+        return count, offset
 
 
     def read_checkpoint(self):
         '''Read checkpoint file to get current state of hash table and load trxns'''
 
         print("Restoring previous checkpoint...")
+        recovery_start = time.time()
 
-        if not os.path.exists(CHECK_FILE):
-            with open(CHECK_FILE, "w") as fh:
-                fh.flush()
-                os.fsync(fh.fileno())
+        # a log written before segments existed becomes segment 0
+        if os.path.exists(self.trxn_log):
+            os.rename(self.trxn_log, self.segment_path(0))
 
-        if not os.path.exists(TRXN_LOG):
-            with open(TRXN_LOG, "w") as fh:
-                fh.flush()
-                os.fsync(fh.fileno())
-        
         # load current checkpoint state of hash table
-        with open(CHECK_FILE, "r") as fh:
-            for line in fh:
-                data = json.loads(line)
-                result = self.hash_table.insert(data["key"], data["value"])
-        
-        # replay transactions
-        trxn_fh = open(TRXN_LOG, "r+")
-        self.hash_table.trxn_fh = trxn_fh
-        for line in trxn_fh:
-            json_req = json.loads(line)
-            self.call_req_op(json_req)
-            self.hash_table.num_trxns += 1
-
-        print("Previous checkpoint restored\n")
+        start = time.time()
+        expires = {}
+        versions = {}
+        covered, records = Checkpoint.read_checkpoint(self.check_file, expires, versions)
+        self.hash_table.load(records, expires, versions)
+        print(f'Loaded {len(self.hash_table.dictionary)} keys in {time.time() - start:.2f} seconds')
+
+        # replay transactions of the segments newer than the checkpoint;
+        # they stay on disk until the next checkpoint covers them, and new
+        # transactions go to a fresh segment
+        self.remove_segments(covered)
+        segments = [segment for segment in self.list_segments() if segment > covered]
+        self.segment = max(segments + [covered]) + 1
+
+        start = time.time()
+        for segment in segments:
+            count, size = self.replay_segment(segment)
+            self.hash_table.num_trxns += count
+            self.log_bytes += size
+        elapsed = time.time() - start
+
+        count = self.hash_table.num_trxns
+        print(f'Replayed {count} transactions from {len(segments)} log segments '
+              f'in {elapsed:.2f} seconds ({count / max(elapsed, 1e-9):.0f} trxns/second)')
+        print(f'Previous checkpoint restored in {time.time() - recovery_start:.2f} seconds\n')
+
+        # the limits may have been lowered since the table was written
+        self.evict()
 
 
     def conn_to_name_serv(self):
@@ -298,6 +2018,160 @@ class HashTableServer:
         sock.sendto(status.encode('utf-8'), addr)
 
 
+def parse_size(value):
+    '''Parse a --max-memory option such as 1048576, 512K, 64M or 2G'''
+
+    number = value.rstrip("KMGkmg")
+    unit = value[len(number):].upper()
+
+    try:
+        return int(number) * SIZE_UNITS[unit]
+    except (ValueError, KeyError):
+        raise argparse.ArgumentTypeError(f'invalid size: {value}')
+
+
+def parse_durability(value):
+    '''Parse a --durability option into a (mode, interval in ms) tuple'''
+
+    mode, _, interval = value.partition("=")
+    if (mode not in DURABILITY_MODES or bool(interval) != (mode == "interval")):
+        raise argparse.ArgumentTypeError(f'invalid durability: {value}')
+
+    try:
+        interval = int(interval) if interval else 0
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid durability interval: {interval}')
+
+    return mode, interval
+
+
+def raise_fd_limit():
+    '''Raise the soft limit on open files to the hard limit so that one
+    server process can hold many idle client connections'''
+
+    if not resource:
+        return
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError):
+        print(f'Server: Open file limit stays at {soft}')
+
+
+def check_layout(workers):
+    '''Make sure the data files on disk were written with the same number of
+    workers, since each worker only loads the files of its own shard'''
+
+    written = 1
+    if os.path.exists(LAYOUT_FILE):
+        with open(LAYOUT_FILE, "r") as fh:
+            written = int(fh.read())
+
+    prefix = os.path.splitext(CHECK_FILE)[0] + "."
+    data = [name for name in os.listdir(".")
+            if name.startswith(prefix) and name != LAYOUT_FILE]
+
+    if (data and written != workers):
+        print(f'Server: Data files were written by {written} workers, not {workers}')
+        return False
+
+    if (workers != 1 or os.path.exists(LAYOUT_FILE)):
+        with open(LAYOUT_FILE, "w") as fh:
+            fh.write(str(workers))
+
+    return True
+
+
+def run_workers(hash_server, project):
+    '''Fork a worker process for each shard of the keys, all accepting
+    clients on the same port, and keep that port registered with the name
+    server for as long as every worker is running'''
+
+    workers = hash_server.workers
+
+    # give each worker its own listening socket on the same port if the
+    # kernel can balance connections between them; otherwise they share one
+    if hasattr(socket, "SO_REUSEPORT"):
+        listeners = [hash_server.create_TCP_connection(reuse_port=True)]
+        port_listen = listeners[0].getsockname()[1]
+        for _ in range(workers - 1):
+            listeners.append(hash_server.create_TCP_connection(port_listen, True))
+    else:
+        listeners = [hash_server.create_TCP_connection()] * workers
+        port_listen = listeners[0].getsockname()[1]
+
+    # workers forward requests for keys they do not own to each other
+    peer_listeners = []
+    for _ in range(workers):
+        peer_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        peer_socket.bind((PEER_HOST, 0))
+        peer_socket.listen(socket.SOMAXCONN)
+        peer_listeners.append(peer_socket)
+    peer_ports = [peer_socket.getsockname()[1] for peer_socket in peer_listeners]
+
+    parent = os.getpid()
+    pids = []
+    for shard in range(workers):
+        pid = os.fork()
+        if (pid == 0):
+            status = 1
+            try:
+                own = {listeners[shard], peer_listeners[shard]}
+                for sock in set(listeners + peer_listeners) - own:
+                    sock.close()
+
+                hash_server.start_worker(shard, workers, peer_ports)
+                hash_server.read_checkpoint()
+                hash_server.listen(listeners[shard])
+                hash_server.listen(peer_listeners[shard])
+
+                # serve until the parent process goes away
+                while (os.getppid() == parent):
+                    hash_server.serve_once(PARENT_POLL)
+                status = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(status)
+
+        pids.append(pid)
+
+    # only the workers accept connections
+    for sock in set(listeners + peer_listeners):
+        sock.close()
+
+    try:
+        # connect socket to name server
+        name_serv = hash_server.conn_to_name_serv()
+        if not name_serv:
+            print('Server: Could not connect to name server')
+            return 1
+
+        name_sock, name_addr = name_serv
+        hash_server.update_name_serv(name_sock, name_addr, port_listen, project, "kfriday")
+        start = time.time()
+
+        while True:
+            # update name server every minute
+            if (time.time() - start >= 60):
+                hash_server.update_name_serv(name_sock, name_addr, port_listen, project, "kfriday")
+                start = time.time()
+
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid in pids:
+                print(f'Server: Worker {pids.index(pid)} exited')
+                return 1
+
+            time.sleep(1)
+    finally:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
 def main():
     '''Runner function to spin up RPC server'''
     
@@ -308,6 +2182,14 @@ def main():
     if not project:
         return 1
 
+    raise_fd_limit()
+
+    if not check_layout(hash_server.workers):
+        return 1
+
+    if (hash_server.workers > 1):
+        return run_workers(hash_server, project)
+
     # load current state of hash table
     hash_server.read_checkpoint()
 
@@ -316,7 +2198,7 @@ def main():
     except ConnectionResetError as err:
         return 1
 
-    hash_server.client_socks[serv_socket.getsockname()] = serv_socket
+    hash_server.listen(serv_socket)
 
     # connect socket to name server
     name_serv = hash_server.conn_to_name_serv()
@@ -338,35 +2220,12 @@ def main():
             hash_server.update_name_serv(name_sock, name_addr, port_listen, project, "kfriday")
             start = time.time()
 
-        # check if any sockets are open; timeout after 60 seconds
-        ready_socks, _, _ = select.select(hash_server.client_socks.values(), [], [], 60)
-        for sock in ready_socks:
-            if (sock == serv_socket):
-                new_client, addr = serv_socket.accept()
-                # set failure timeout to 30 seconds
-                new_client.settimeout(30)
-
-                # add client socket to dictionary
-                hash_server.client_socks[addr] = new_client
-                print(f'Server: Client connected: {addr}')
-                continue
-
-            try:
-                sock_addr = sock.getpeername()
-                if not hash_server.decode_request(sock):
-                    # remove socket from dictionary
-                    hash_server.client_socks.pop(sock_addr)
-                    print(f'Server: Disconnecting {sock_addr}')
-                    sock.close()
-            except socket.error:
-                hash_server.client_socks.pop(sock_addr)
-                print(f'Server: Disconnecting {sock_addr}')
-                sock.close()
-                break
+        hash_server.serve_once(60)
 
     serv_socket.close()
     name_sock.close()
-    hash_server.hash_table.trxn_fh.close()
+    if hash_server.hash_table.trxn_fh:
+        hash_server.hash_table.trxn_fh.close()
 
     return 0
 
@@ -0,0 +1,205 @@
+# Migration.py
+# Author: Kristen Friday
+# Date: October 18, 2026
+
+# Moving keys between the servers of a cluster when it grows (see
+# Rebalance.py). Each server walks a snapshot of its keys and streams, in
+# batches, every key it is the old primary of to the servers that hold the
+# key under the new placement but did not under the old one (see HashRing).
+# The walk is throttled to a number of keys per second and only a few
+# batches are in flight per server, so that foreground requests keep their
+# latency. Once every server has streamed its keys and the clients have
+# switched to the new placement, each server drops the keys it no longer
+# holds.
+
+import time
+import HashRing
+
+
+# keys per batch sent to a server
+MIGRATE_BATCH = 500
+# keys examined per second (0 for no limit)
+MIGRATE_RATE = 50000
+# batches sent to one server that may wait for its acknowledgement
+MAX_INFLIGHT = 4
+
+# the phases of a migration
+STREAMING = "streaming"
+STREAMED = "streamed"
+DROPPING = "dropping"
+DONE = "done"
+PHASES = (STREAMING, STREAMED, DROPPING, DONE)
+
+
+class Migration:
+
+    '''The progress of one server through a migration'''
+
+    def __init__(self, name, old_nodes, nodes, vnodes, replicas, servers, keys,
+            rate=MIGRATE_RATE, batch=MIGRATE_BATCH):
+        '''Initialize the migration of the given snapshot of keys for the
+        server called name, from the ring of old_nodes to that of nodes;
+        servers maps the name of every server to its (host, port)'''
+
+        self.name = name
+        self.servers = servers
+        self.old_ring = HashRing.HashRing(old_nodes, vnodes)
+        self.ring = HashRing.HashRing(nodes, vnodes)
+        self.replicas = replicas
+        self.rate = rate
+        self.batch = batch
+
+        self.phase = STREAMING
+        self.keys = keys
+        self.position = 0
+        # keys waiting to be sent, by server: they go out once there is a
+        # full batch for the server (or the snapshot ends), and keys that
+        # failed to reach it are queued again
+        self.queued = {}
+        self.inflight = {}
+        # time (monotonic) before which a server that could not be reached
+        # is not tried again
+        self.backoff = {}
+        # keys removed while keys are streamed, which must not be brought
+        # back by a batch that was sent before the removal
+        self.removed = set()
+
+        # allowance of keys that may be examined, refilled at rate
+        self.allowance = batch
+        self.refilled = time.monotonic()
+
+        self.started = time.time()
+        self.phase_started = self.started
+        self.finished = None
+        self.examined = 0
+        self.sent = 0
+        self.batches = 0
+        self.bytes_sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+
+    def targets_of(self, key):
+        '''Return the servers a key has to be sent to by this server'''
+
+        old = self.old_ring.nodes_of(key, self.replicas)
+        if (old[0] != self.name):
+            return ()
+
+        return [node for node in self.ring.nodes_of(key, self.replicas) if node not in old]
+
+
+    def holds(self, key):
+        '''Return whether this server holds a key under the new placement'''
+
+        return self.name in self.ring.nodes_of(key, self.replicas)
+
+
+    def budget(self):
+        '''Return how many keys may be examined now without going over the
+        rate, and use them up'''
+
+        if not self.rate:
+            return self.batch
+
+        now = time.monotonic()
+        self.allowance = min(self.batch,
+                self.allowance + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+        count = int(self.allowance)
+        self.allowance -= count
+
+        return count
+
+
+    def next_keys(self, count):
+        '''Return the next count keys of the snapshot (fewer at its end)'''
+
+        keys = self.keys[self.position:self.position + count]
+        self.position += len(keys)
+        self.examined += len(keys)
+
+        return keys
+
+
+    def queue(self, keys):
+        '''Queue the keys this server has to send for each server'''
+
+        for key in keys:
+            for target in self.targets_of(key):
+                self.queued.setdefault(target, []).append(key)
+
+
+    def note_removed(self, keys):
+        '''Remember keys removed from this server while batches may still
+        arrive; once every server streamed its keys, none do'''
+
+        if (self.phase in (STREAMING, STREAMED)):
+            self.removed.update(keys)
+
+
+    def requeue(self, target, keys):
+        '''Queue some keys to be sent to a server again'''
+
+        self.queued.setdefault(target, []).extend(keys)
+        self.failed += len(keys)
+
+
+    def take_batch(self, target, now):
+        '''Return the next batch of keys to send to a server, or None if it
+        should wait for more keys, for acknowledgements or to be retried'''
+
+        keys = self.queued.get(target)
+        if (not keys or self.backoff.get(target, 0) > now):
+            return None
+        if (self.inflight.get(target, 0) >= MAX_INFLIGHT):
+            return None
+        if (len(keys) < self.batch and not self.exhausted()):
+            return None
+
+        batch = keys[:self.batch]
+        del keys[:self.batch]
+        if not keys:
+            del self.queued[target]
+
+        return batch
+
+
+    def begin_drop(self, keys):
+        '''Move on to dropping the keys of a new snapshot that this server
+        no longer holds'''
+
+        self.phase = DROPPING
+        self.keys = keys
+        self.position = 0
+        self.examined = 0
+        self.phase_started = time.time()
+
+
+    def exhausted(self):
+        '''Return whether every key of the snapshot was examined'''
+
+        return (self.position >= len(self.keys))
+
+
+    def progress(self):
+        '''Return the counters of the migration; examined counts the keys of
+        the snapshot of the current phase'''
+
+        now = self.finished or time.time()
+        elapsed = now - self.started
+
+        return {
+            "phase": self.phase,
+            "keys": len(self.keys),
+            "examined": self.examined,
+            "sent": self.sent,
+            "batches": self.batches,
+            "bytes_sent": self.bytes_sent,
+            "failed": self.failed,
+            "inflight": sum(self.inflight.values()),
+            "dropped": self.dropped,
+            "elapsed": elapsed,
+            "keys_per_second": self.examined / max(now - self.phase_started, 1e-9)
+        }
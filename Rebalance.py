@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+# Rebalance.py
+# Author: Kristen Friday
+# Date: October 18, 2026
+
+# Grows a cluster of N servers (PROJECT-0 .. PROJECT-N-1, already running
+# and registered with the name server, as are the new ones) to NEW_N
+# servers while it stays online. Every server streams the keys that move
+# under the new ring to their new servers in batches (see Migration.py),
+# throttled to RATE keys per second each; meanwhile ClusterClient writes
+# keys to both their old and new servers and reads the new ones first.
+# Once every key was streamed, the servers drop the keys they no longer
+# hold. Clients other than this one must be switched to the new placement
+# (ClusterClient.expand, then finish_expansion) before that point.
+#
+# A key removed by a client on its old servers while its batch is on the
+# way is not brought back: the new servers remember the keys removed
+# until every server streamed its keys and skip them when they arrive.
+
+import sys
+import time
+import socket
+import ClusterClient
+import Migration
+
+
+# seconds between progress reports
+POLL_INTERVAL = 1
+
+
+def send_all(client, message):
+    '''Send a request to every server of the cluster; return the results
+    by server name, or None if a server refused it'''
+
+    results = {}
+    for name, server in client.servers.items():
+        try:
+            response = client.call_operation(server, message)
+        except (KeyError, TypeError, socket.error) as err:
+            print(f'Error: {name} refused {message.get("action")}: {type(err).__name__}')
+            return None
+        if (response["status"] != "Success"):
+            print(f'Error: {name} refused {message.get("action")}: {response}')
+            return None
+        results[name] = response["result"]
+
+    return results
+
+
+def wait_for(client, phase):
+    '''Report the progress of every server until all reach phase; return
+    their last progress'''
+
+    message = {"method": "migrate", "action": "status"}
+
+    while True:
+        results = send_all(client, message)
+        if results is None:
+            return None
+
+        examined = sum(result["examined"] for result in results.values())
+        total = sum(result["keys"] for result in results.values())
+        sent = sum(result["sent"] for result in results.values())
+        rate = sum(result["keys_per_second"] for result in results.values())
+        print(f'{phase:>9}: {examined}/{total} keys examined, {sent} sent, '
+              f'{rate:.0f} keys/second')
+
+        if all(Migration.PHASES.index(result["phase"]) >= Migration.PHASES.index(phase)
+                for result in results.values()):
+            return results
+
+        time.sleep(POLL_INTERVAL)
+
+
+def get_cml_args():
+    '''Get project, servers, replicas and new number of servers from the
+    command line, with the optional rate and batch size'''
+
+    if (len(sys.argv) not in (5, 6, 7)):
+        print(f'Usage: ./Rebalance.py [PROJECT] [N] [K] [NEW_N] [RATE] [BATCH]')
+        return None
+
+    project, n, k, new_n = sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])
+    rate = float(sys.argv[5]) if len(sys.argv) > 5 else Migration.MIGRATE_RATE
+    batch = int(sys.argv[6]) if len(sys.argv) > 6 else Migration.MIGRATE_BATCH
+
+    return project, n, k, new_n, rate, batch
+
+
+def main():
+    '''Runner function to grow a cluster'''
+
+    args = get_cml_args()
+    if not args:
+        return 1
+
+    project, n, k, new_n, rate, batch = args
+    if (new_n <= n):
+        print('Error: NEW_N must be larger than N')
+        return 1
+
+    client = ClusterClient.ClusterClient(n, k, project)
+    client.expand(new_n)
+
+    servers = {name: [server.server["name"], server.server["port"]]
+            for name, server in client.servers.items()}
+    start = time.time()
+
+    # every server snapshots its keys and starts streaming them; the new
+    # servers start first, so that they track removals before keys arrive
+    for name in sorted(client.servers, key=lambda name: name in client.old_ring.nodes):
+        message = {
+            "method": "migrate",
+            "action": "start",
+            "name": name,
+            "old_nodes": client.old_ring.nodes,
+            "nodes": client.ring.nodes,
+            "vnodes": client.ring.vnodes,
+            "replicas": k,
+            "servers": servers,
+            "rate": rate,
+            "batch": batch
+        }
+        try:
+            response = client.call_operation(client.servers[name], message)
+        except (KeyError, TypeError, socket.error) as err:
+            print(f'Error: {name} could not start migrating: {type(err).__name__}')
+            return 1
+        if (response["status"] != "Success"):
+            print(f'Error: {name} could not start migrating: {response}')
+            return 1
+
+    streamed = wait_for(client, Migration.STREAMED)
+    if streamed is None:
+        return 1
+
+    # every key is on its new servers, so the old copies can go
+    client.finish_expansion()
+    if send_all(client, {"method": "migrate", "action": "finish"}) is None:
+        return 1
+
+    done = wait_for(client, Migration.DONE)
+    if done is None:
+        return 1
+
+    print(f'Grew {project} from {n} to {new_n} servers in {time.time() - start:.2f} seconds')
+    print(f'Keys Streamed:         {sum(result["sent"] for result in done.values())}')
+    print(f'Batches:               {sum(result["batches"] for result in done.values())}')
+    print(f'Bytes Streamed:        {sum(result["bytes_sent"] for result in done.values())}')
+    print(f'Retried Keys:          {sum(result["failed"] for result in done.values())}')
+    print(f'Keys Dropped:          {sum(result["dropped"] for result in done.values())}')
+
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
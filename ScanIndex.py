@@ -0,0 +1,469 @@
+# ScanIndex.py
+# Author: Kristen Friday
+# Date: October 18, 2026
+
+# Secondary indexes over the keys of a HashTable that let scan avoid
+# matching the regular expression against every key:
+#  - the keys in sorted order, for expressions anchored to a literal prefix
+#  - optionally, the keys containing each trigram (three characters), for
+#    expressions that contain a literal of three or more characters
+# The planner pulls the prefix and literals out of the parsed expression
+# and falls back to a full scan when there are none. Tables using the
+# compact storage engine keep their sorted keys packed to save memory (see
+# PackedKeys).
+
+import re
+import bisect
+import functools
+import itertools
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+
+# keys per bucket of SortedKeys before the bucket is split in two
+BUCKET_SIZE = 1000
+# the same for PackedKeys, whose buckets are rewritten on every change
+PACKED_BUCKET_SIZE = 32
+# separates the keys of a bucket of PackedKeys; never a byte of utf-8
+SEPARATOR = b"\xff"
+# number of compiled and planned expressions kept by plan()
+REGEX_CACHE = 256
+# expressions with these flags cannot use the index
+UNINDEXED_FLAGS = sre_constants.SRE_FLAG_IGNORECASE
+
+
+class SortedKeys:
+
+    '''Keys kept in sorted order in a list of bounded buckets, so that an
+    insert or remove only moves the entries of one bucket'''
+
+    def __init__(self):
+        '''Initialize an empty list of keys'''
+
+        self.buckets = []
+        # the largest key of each bucket
+        self.maxes = []
+        self.size = 0
+
+
+    def __len__(self):
+        '''Return the number of keys'''
+
+        return self.size
+
+
+    def rebuild(self, keys):
+        '''Replace the contents with the given distinct keys'''
+
+        keys = sorted(keys)
+        step = BUCKET_SIZE // 2
+
+        self.buckets = [keys[i:i + step] for i in range(0, len(keys), step)]
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+        self.size = len(keys)
+
+
+    def add(self, key):
+        '''Insert a key that is not present yet'''
+
+        if not self.buckets:
+            self.buckets.append([key])
+            self.maxes.append(key)
+            self.size = 1
+            return
+
+        i = bisect.bisect_left(self.maxes, key)
+        if (i == len(self.maxes)):
+            i -= 1
+            self.buckets[i].append(key)
+            self.maxes[i] = key
+        else:
+            bisect.insort(self.buckets[i], key)
+        self.size += 1
+
+        bucket = self.buckets[i]
+        if (len(bucket) > BUCKET_SIZE):
+            half = len(bucket) // 2
+            self.buckets.insert(i + 1, bucket[half:])
+            self.maxes.insert(i + 1, bucket[-1])
+            del bucket[half:]
+            self.maxes[i] = bucket[-1]
+
+
+    def discard(self, key):
+        '''Remove a key if it is present'''
+
+        i = bisect.bisect_left(self.maxes, key)
+        if (i == len(self.maxes)):
+            return
+
+        bucket = self.buckets[i]
+        j = bisect.bisect_left(bucket, key)
+        if (bucket[j] != key):
+            return
+
+        del bucket[j]
+        self.size -= 1
+
+        if not bucket:
+            del self.buckets[i]
+            del self.maxes[i]
+        elif (j == len(bucket)):
+            self.maxes[i] = bucket[-1]
+
+
+    def irange(self, start=None, stop=None, reverse=False):
+        '''Yield the keys from start (inclusive) up to stop (exclusive) in
+        order, or in reverse order; None means from the first or up to the
+        last key'''
+
+        if reverse:
+            yield from self.irange_reverse(start, stop)
+            return
+
+        i = 0
+        j = 0
+        if start is not None:
+            i = bisect.bisect_left(self.maxes, start)
+            if (i < len(self.buckets)):
+                j = bisect.bisect_left(self.buckets[i], start)
+
+        for bucket in self.buckets[i:]:
+            for key in bucket[j:] if j else bucket:
+                if (stop is not None and key >= stop):
+                    return
+                yield key
+            j = 0
+
+
+    def irange_reverse(self, start=None, stop=None):
+        '''Yield the keys from start (inclusive) up to stop (exclusive) from
+        the largest to the smallest'''
+
+        if not self.buckets:
+            return
+
+        i = len(self.buckets) - 1
+        j = len(self.buckets[i])
+        if stop is not None:
+            i = min(bisect.bisect_left(self.maxes, stop), i)
+            j = bisect.bisect_left(self.buckets[i], stop)
+
+        while (i >= 0):
+            bucket = self.buckets[i]
+            for k in range(j - 1, -1, -1):
+                if (start is not None and bucket[k] < start):
+                    return
+                yield bucket[k]
+            i -= 1
+            j = len(self.buckets[i]) if i >= 0 else 0
+
+
+class PackedKeys:
+
+    '''Keys kept in sorted order in buckets like SortedKeys, but with each
+    bucket packed into a single bytes object of utf-8 keys, so that a key
+    costs about its length rather than a str object. Since utf-8 sorts by
+    code point, the packed keys compare as the keys do. A bucket is split
+    apart and joined again to change it, so buckets are kept small.'''
+
+    def __init__(self):
+        '''Initialize an empty list of keys'''
+
+        self.buckets = []
+        # the largest key of each bucket, as bytes
+        self.maxes = []
+        self.size = 0
+
+
+    def __len__(self):
+        '''Return the number of keys'''
+
+        return self.size
+
+
+    def rebuild(self, keys):
+        '''Replace the contents with the given distinct keys'''
+
+        keys = sorted(key.encode('utf-8') for key in keys)
+        step = PACKED_BUCKET_SIZE // 2
+
+        self.buckets = [SEPARATOR.join(keys[i:i + step]) for i in range(0, len(keys), step)]
+        self.maxes = [keys[min(i + step, len(keys)) - 1] for i in range(0, len(keys), step)]
+        self.size = len(keys)
+
+
+    def add(self, key):
+        '''Insert a key that is not present yet'''
+
+        key = key.encode('utf-8')
+        self.size += 1
+
+        if not self.buckets:
+            self.buckets.append(key)
+            self.maxes.append(key)
+            return
+
+        i = min(bisect.bisect_left(self.maxes, key), len(self.maxes) - 1)
+        keys = self.buckets[i].split(SEPARATOR)
+        bisect.insort(keys, key)
+
+        if (len(keys) > PACKED_BUCKET_SIZE):
+            half = len(keys) // 2
+            self.buckets[i:i + 1] = [SEPARATOR.join(keys[:half]), SEPARATOR.join(keys[half:])]
+            self.maxes[i:i + 1] = [keys[half - 1], keys[-1]]
+        else:
+            self.buckets[i] = SEPARATOR.join(keys)
+            self.maxes[i] = keys[-1]
+
+
+    def discard(self, key):
+        '''Remove a key if it is present'''
+
+        key = key.encode('utf-8')
+
+        i = bisect.bisect_left(self.maxes, key)
+        if (i == len(self.maxes)):
+            return
+
+        keys = self.buckets[i].split(SEPARATOR)
+        j = bisect.bisect_left(keys, key)
+        if (keys[j] != key):
+            return
+
+        del keys[j]
+        self.size -= 1
+
+        if not keys:
+            del self.buckets[i]
+            del self.maxes[i]
+        else:
+            self.buckets[i] = SEPARATOR.join(keys)
+            self.maxes[i] = keys[-1]
+
+
+    def irange(self, start=None, stop=None, reverse=False):
+        '''Yield the keys from start (inclusive) up to stop (exclusive) in
+        order, or in reverse order; None means from the first or up to the
+        last key'''
+
+        start = start.encode('utf-8') if start is not None else None
+        stop = stop.encode('utf-8') if stop is not None else None
+
+        if reverse:
+            yield from self.irange_reverse(start, stop)
+            return
+
+        i = 0 if start is None else bisect.bisect_left(self.maxes, start)
+        for bucket in itertools.islice(self.buckets, i, None):
+            keys = bucket.split(SEPARATOR)
+            j = 0 if start is None else bisect.bisect_left(keys, start)
+            for key in itertools.islice(keys, j, None):
+                if (stop is not None and key >= stop):
+                    return
+                yield key.decode('utf-8')
+            start = None
+
+
+    def irange_reverse(self, start, stop):
+        '''Yield the (utf-8) keys from start (inclusive) up to stop
+        (exclusive) from the largest to the smallest'''
+
+        if not self.buckets:
+            return
+
+        i = len(self.buckets) - 1
+        if stop is not None:
+            i = min(bisect.bisect_left(self.maxes, stop), i)
+
+        while (i >= 0):
+            keys = self.buckets[i].split(SEPARATOR)
+            j = len(keys) if stop is None else bisect.bisect_left(keys, stop)
+            for k in range(j - 1, -1, -1):
+                if (start is not None and keys[k] < start):
+                    return
+                yield keys[k].decode('utf-8')
+            stop = None
+            i -= 1
+
+
+class ScanIndex:
+
+    '''The sorted keys of a table, and optionally a trigram index'''
+
+    def __init__(self, trigrams=False, packed=False):
+        '''Initialize empty indexes; with packed, the sorted keys are kept
+        packed into bytes (see PackedKeys)'''
+
+        self.keys = PackedKeys() if packed else SortedKeys()
+        self.trigrams = {} if trigrams else None
+
+        # how scans were answered
+        self.full_scans = 0
+        self.prefix_scans = 0
+        self.trigram_scans = 0
+
+
+    def add(self, key):
+        '''Index a new key'''
+
+        self.keys.add(key)
+
+        if self.trigrams is not None:
+            for trigram in trigrams_of(key):
+                self.trigrams.setdefault(trigram, set()).add(key)
+
+
+    def discard(self, key):
+        '''Remove a key from the indexes'''
+
+        self.keys.discard(key)
+
+        if self.trigrams is not None:
+            for trigram in trigrams_of(key):
+                keys = self.trigrams.get(trigram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.trigrams[trigram]
+
+
+    def rebuild(self, keys):
+        '''Index every key of a freshly loaded table'''
+
+        self.keys.rebuild(keys)
+
+        if self.trigrams is not None:
+            self.trigrams = {}
+            for key in keys:
+                for trigram in trigrams_of(key):
+                    self.trigrams.setdefault(trigram, set()).add(key)
+
+
+    def candidates(self, prefix, literals):
+        '''Return the keys that may match an expression with the given
+        literal prefix and required literals, or None if every key may'''
+
+        if prefix:
+            self.prefix_scans += 1
+            return self.keys.irange(prefix, prefix_end(prefix))
+
+        if (self.trigrams is not None and literals):
+            self.trigram_scans += 1
+            postings = [self.trigrams.get(trigram, ())
+                    for literal in literals for trigram in trigrams_of(literal)]
+            postings.sort(key=len)
+            return set(postings[0]).intersection(*postings[1:])
+
+        self.full_scans += 1
+        return None
+
+
+    def ordered_candidates(self, prefix, literals, after=None):
+        '''Return the keys greater than after (all keys if None) that may
+        match an expression with the given prefix and literals, in order'''
+
+        keys = self.candidates(prefix, literals)
+
+        if keys is None:
+            keys = self.keys.irange(after)
+        elif prefix:
+            if (after is not None and after > prefix):
+                keys = self.keys.irange(after, prefix_end(prefix))
+        else:
+            keys = sorted(key for key in keys if after is None or key > after)
+
+        return (key for key in keys if key != after)
+
+
+    def stats(self):
+        '''Return the counters of the scan planner'''
+
+        cache = plan.cache_info()
+
+        return {
+            "scan_full": self.full_scans,
+            "scan_prefix": self.prefix_scans,
+            "scan_trigram": self.trigram_scans,
+            "regex_cache_hits": cache.hits,
+            "regex_cache_misses": cache.misses
+        }
+
+
+def trigrams_of(text):
+    '''Return the distinct trigrams of a string'''
+
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def prefix_end(prefix):
+    '''Return the smallest string greater than every string starting with
+    prefix, or None if there is none'''
+
+    while prefix:
+        last = ord(prefix[-1])
+        if (last < 0x10FFFF):
+            return prefix[:-1] + chr(last + 1)
+        prefix = prefix[:-1]
+
+    return None
+
+
+def flatten(items):
+    '''Expand groups without flags into the sequence around them, since
+    matching them is the same as matching their contents in place'''
+
+    flat = []
+    for op, arg in items:
+        if (op == sre_constants.SUBPATTERN and not arg[1] and not arg[2]):
+            flat += flatten(arg[3])
+        else:
+            flat.append((op, arg))
+
+    return flat
+
+
+@functools.lru_cache(maxsize=REGEX_CACHE)
+def plan(pattern):
+    '''Compile an expression and find the literal prefix every matching key
+    starts with (empty if none) and the literals of three or more
+    characters every matching key contains; raise re.error if invalid'''
+
+    regex = re.compile(pattern)
+    parsed = sre_parse.parse(pattern)
+
+    flags = getattr(parsed, "state", getattr(parsed, "pattern", None)).flags
+    if (flags & UNINDEXED_FLAGS):
+        return regex, "", ()
+
+    items = flatten(parsed.data)
+
+    # a prefix needs ^ (without MULTILINE) or \A before the literals
+    prefix = ""
+    if items and items[0][0] == sre_constants.AT:
+        anchor = items[0][1]
+        if (anchor == sre_constants.AT_BEGINNING_STRING or
+                (anchor == sre_constants.AT_BEGINNING and
+                 not flags & sre_constants.SRE_FLAG_MULTILINE)):
+            for op, arg in items[1:]:
+                if (op != sre_constants.LITERAL):
+                    break
+                prefix += chr(arg)
+
+    # runs of consecutive literals are required in every match
+    literals = []
+    run = ""
+    for op, arg in items + [(None, None)]:
+        if (op == sre_constants.LITERAL):
+            run += chr(arg)
+            continue
+        if (len(run) >= 3):
+            literals.append(run)
+        run = ""
+
+    return regex, prefix, tuple(literals)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+# TestDurability.py
+# Author: Kristen Friday
+# Date: October 18, 2026
+
+# Measures insert throughput of the server for each durability mode.
+# Requests are fed straight to HashTableServer, CLIENTS at a time per pass
+# of the event loop, so that group commit sees the same batches it would
+# with that many connected clients.
+
+import sys
+import os
+import time
+import collections
+import tempfile
+import json
+import HashTableServer
+import BinaryProtocol
+
+
+MODES = ["always", "group", "interval=10", "off"]
+
+
+class NullConn:
+
+    '''Stands in for a client connection; the server does not try to write
+    to a closed connection, so responses only pile up in outbuf'''
+
+    def __init__(self):
+        self.outbuf = bytearray()
+        self.closed = True
+        # the ordered reply queue of a JSON client (see HashTableServer.Reply)
+        self.replies = collections.deque()
+        self.protocol = "json"
+        self.req_id = 0
+
+
+def time_insert(mode, clients, seconds):
+    '''Measure insert throughput of the server with the given durability'''
+
+    server = HashTableServer.HashTableServer()
+    server.set_durability(*HashTableServer.parse_durability(mode))
+    conn = NullConn()
+
+    count = 0
+    start = time.time_ns()
+    while time.time_ns() - start < seconds * (10 ** 9):
+        # one pass of the event loop serves one request per client
+        for _ in range(clients):
+            req = {"method": "insert", "key": str(count), "value": str(count)}
+            server.send_response(conn, server.call_req_op(req))
+            count += 1
+
+            if (server.group_size >= server.group_records):
+                server.commit_transactions()
+
+        if server.commit_due():
+            server.commit_transactions()
+        conn.outbuf.clear()
+
+    server.commit_transactions()
+    elapsed = time.time_ns() - start
+
+    print(f"{mode:<14}{count:>12}{count / (elapsed / (10 ** 9)):>14.0f}")
+
+
+def check_restart():
+    '''Insert a value over the binary protocol that has line breaks in its
+    JSON, restart the server and check that it recovers the value from its
+    log; return whether it did'''
+
+    value = b'{\n"a": 1\n}'
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cwd = os.getcwd()
+        os.chdir(tmp_dir)
+        try:
+            server = HashTableServer.HashTableServer()
+            server.read_checkpoint()
+            req = BinaryProtocol.decode_request(BinaryProtocol.OP_INSERT, b"lines", value)
+            server.call_req_op(req)
+            server.commit_transactions()
+            server.hash_table.trxn_fh.close()
+
+            restarted = HashTableServer.HashTableServer()
+            restarted.read_checkpoint()
+            recovered = restarted.hash_table.lookup("lines")
+            if restarted.hash_table.trxn_fh:
+                restarted.hash_table.trxn_fh.close()
+        except ValueError as err:
+            print(f"Restart after a binary insert failed: {err}")
+            return False
+        finally:
+            os.chdir(cwd)
+
+    if (recovered == "KeyError" or json.loads(recovered) != json.loads(value)):
+        print(f"Restart after a binary insert recovered {recovered!r}")
+        return False
+
+    return True
+
+
+def get_cml_args():
+    '''Get number of clients and seconds per mode from command line'''
+
+    if (len(sys.argv) != 3):
+        print(f'Usage: ./TestDurability.py [CLIENTS] [SECONDS]')
+        return None
+
+    return sys.argv[1:]
+
+
+def main():
+    '''Runner function to compare insert throughput of durability modes'''
+
+    args = get_cml_args()
+    if not args:
+        return 1
+
+    clients, seconds = args
+    clients = int(clients)
+    seconds = float(seconds)
+
+    if not check_restart():
+        return 1
+
+    print(f"Insert throughput with {clients} clients:\n")
+    print(f"{'Durability':<14}{'Operations':>12}{'Ops/second':>14}")
+
+    for mode in MODES:
+        # every mode starts from an empty table in a fresh directory
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cwd = os.getcwd()
+            os.chdir(tmp_dir)
+            try:
+                time_insert(mode, clients, seconds)
+            finally:
+                os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# TestMemory.py
+# Author: Kristen Friday
+# Date: October 18, 2026
+
+# Compares the memory used per entry by the dict and compact storage
+# engines of HashTable, along with their insert and lookup speed, for many
+# short keys with short values (runs in-process, no server needed)
+
+import sys
+import time
+import tracemalloc
+import HashTable
+
+
+def make_items(count):
+    '''Yield short keys with short JSON-encoded values, created as they are
+    inserted so that the table is charged for them'''
+
+    for i in range(count):
+        yield f"user:{i:08d}", f'"v{i}"'.encode('utf-8')
+
+
+def measure(engine, count):
+    '''Fill a table using engine; return bytes per entry and the insert and
+    lookup rates'''
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    table = HashTable.HashTable(engine=engine)
+    for key, value in make_items(count):
+        table.insert(key, value)
+
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    # time a second table, since tracing slows down allocations
+    table = HashTable.HashTable(engine=engine)
+    start = time.time()
+    for key, value in make_items(count):
+        table.insert(key, value)
+    insert_time = time.time() - start
+
+    start = time.time()
+    for key, _ in make_items(count):
+        table.lookup(key)
+    lookup_time = time.time() - start
+
+    return used / count, count / insert_time, count / lookup_time
+
+
+def main():
+    '''Runner function to compare the storage engines'''
+
+    if (len(sys.argv) > 2):
+        print(f'Usage: ./TestMemory.py [KEYS]')
+        return 1
+
+    count = int(sys.argv[1]) if len(sys.argv) == 2 else 200000
+
+    for engine in ("dict", "compact"):
+        per_entry, inserts, lookups = measure(engine, count)
+
+        print(f"Engine: {engine}")
+        print(f"Entries:               {count}")
+        print(f"Memory per Entry:      {per_entry:.1f} bytes")
+        print(f"Inserts (ops/sec):     {inserts:.0f} ops/second")
+        print(f"Lookups (ops/sec):     {lookups:.0f} ops/second\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+# TestProtocol.py
+# Author: Kristen Friday
+# Date: October 18, 2026
+
+# Compares the JSON and binary wire protocols against one server: bytes
+# sent per request, and insert and lookup throughput, both one request at
+# a time and pipelined
+
+import sys
+import time
+import HashTableClient
+
+
+KEYS = 10000
+BATCH = 100
+VALUE = {"name": "value", "data": "x" * 64}
+
+
+def connect(host, port, binary):
+    '''Return a client and a socket speaking the chosen protocol'''
+
+    client = HashTableClient.HashTableClient(binary=binary)
+    sock, _ = client.acquire_connection(host, port)
+
+    if (binary and sock not in client.binary_socks):
+        print('Server does not support the binary protocol')
+        sys.exit(1)
+
+    return client, sock
+
+
+def make_message(method, key):
+    '''Return an insert or lookup request for key'''
+
+    if (method == "insert"):
+        return {"method": method, "key": key, "value": VALUE}
+
+    return {"method": method, "key": key}
+
+
+def time_single(client, sock, method, seconds):
+    '''Send one request at a time for the given number of seconds'''
+
+    count = 0
+    start = time.time_ns()
+    while time.time_ns() - start < seconds * (10 ** 9):
+        client.process_request(sock, make_message(method, str(count % KEYS)))
+        count += 1
+
+    return count
+
+
+def time_pipeline(client, sock, method, seconds):
+    '''Pipeline requests in batches for the given number of seconds'''
+
+    count = 0
+    start = time.time_ns()
+    while time.time_ns() - start < seconds * (10 ** 9):
+        messages = [make_message(method, str((count + i) % KEYS)) for i in range(BATCH)]
+        client.pipeline(sock, messages)
+        count += BATCH
+
+    return count
+
+
+def get_cml_args():
+    '''Get host and port from command line'''
+
+    if (len(sys.argv) != 3):
+        print(f'Usage: ./TestProtocol.py [HOST] [PORT]')
+        return None
+
+    return sys.argv[1], int(sys.argv[2])
+
+
+def main():
+    '''Runner function to compare the two wire protocols'''
+
+    args = get_cml_args()
+    if not args:
+        return 1
+
+    host, port = args
+    seconds = 3
+
+    for name, binary in (("JSON", False), ("Binary", True)):
+        client, sock = connect(host, port, binary)
+
+        size = len(client.encode_request(make_message("insert", "1234"), sock))
+
+        print(f"{name} protocol:")
+        print(f"Insert Request Size:   {size} bytes")
+        for method in ("insert", "lookup"):
+            count = time_single(client, sock, method, seconds)
+            print(f"{method:<8} one at a time: {count / seconds:.0f} ops/second")
+            count = time_pipeline(client, sock, method, seconds)
+            print(f"{method:<8} pipelined:     {count / seconds:.0f} ops/second")
+        print()
+
+        sock.close()
+
+
+if __name__ == '__main__':
+    main()
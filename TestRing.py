@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# TestRing.py
+# Author: Kristen Friday
+# Date: October 18, 2026
+
+# Checks the key placement of the consistent hashing ring used by
+# ClusterClient against the old sha256 modulo placement: the share of keys
+# that move when one server is added (about 1/(N+1) is the best possible),
+# how evenly the keys are spread over the servers, and the cost of placing
+# a key (runs in-process, no server needed)
+
+import sys
+import time
+import hashlib
+import HashRing
+
+
+def modulo_server(key, n):
+    '''Place a key the way ClusterClient did before the ring'''
+
+    return int(hashlib.sha256(key.encode('utf-8')).hexdigest(), 16) % n
+
+
+def make_keys(count):
+    '''Return count distinct keys'''
+
+    return [f"user:{i:08d}" for i in range(count)]
+
+
+def report(name, before, after, n):
+    '''Print the share of keys that moved and the spread of the load'''
+
+    moved = sum(a != b for a, b in zip(before, after))
+
+    loads = {}
+    for server in before:
+        loads[server] = loads.get(server, 0) + 1
+    mean = len(before) / n
+
+    print(f"Placement: {name}")
+    print(f"Keys Moved:            {100 * moved / len(before):.1f}% "
+          f"(ideal {100 / (n + 1):.1f}%)")
+    print(f"Busiest Server Load:   {max(loads.values()) / mean:.2f}x the mean")
+    print(f"Idlest Server Load:    {min(loads.values()) / mean:.2f}x the mean")
+
+
+def main():
+    '''Runner function to compare key placements'''
+
+    if (len(sys.argv) > 4):
+        print(f'Usage: ./TestRing.py [SERVERS] [KEYS] [VNODES]')
+        return 1
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    vnodes = int(sys.argv[3]) if len(sys.argv) > 3 else HashRing.VNODES
+
+    keys = make_keys(count)
+
+    start = time.time()
+    before = [modulo_server(key, n) for key in keys]
+    modulo_time = time.time() - start
+    after = [modulo_server(key, n + 1) for key in keys]
+    report("sha256 modulo", before, after, n)
+    print(f"Placements (ops/sec):  {count / modulo_time:.0f} ops/second\n")
+
+    names = [f"server-{i}" for i in range(n)]
+    ring = HashRing.HashRing(names, vnodes)
+    start = time.time()
+    before = [ring.node_of(key) for key in keys]
+    ring_time = time.time() - start
+
+    ring.add(f"server-{n}")
+    after = [ring.node_of(key) for key in keys]
+    report(f"ring with {vnodes} vnodes", before, after, n)
+    print(f"Placements (ops/sec):  {count / ring_time:.0f} ops/second\n")
+
+
+if __name__ == '__main__':
+    main()
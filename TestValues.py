@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+# TestValues.py
+# Author: Kristen Friday
+# Date: October 18, 2026
+
+# Measures lookup and scan throughput for large JSON values, and compares
+# the memory the server reports for its stored (encoded) values with the
+# memory the same values would take as decoded Python objects
+
+import sys
+import json
+import time
+import HashTableClient
+
+
+KEYS = 2000
+BATCH = 100
+
+
+def make_value(i):
+    '''Return a large nested JSON value'''
+
+    return {
+        "id": i,
+        "name": f"item-{i}",
+        "tags": [f"tag-{j}" for j in range(20)],
+        "readings": [j * 0.5 for j in range(100)],
+        "owner": {"name": "kfriday", "active": True}
+    }
+
+
+def deep_size(obj):
+    '''Return the memory taken by a decoded JSON object and its contents'''
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key) + deep_size(value) for key, value in obj.items())
+    elif isinstance(obj, list):
+        size += sum(deep_size(item) for item in obj)
+
+    return size
+
+
+def get_cml_args():
+    '''Get host and port from command line'''
+
+    if (len(sys.argv) != 3):
+        print(f'Usage: ./TestValues.py [HOST] [PORT]')
+        return None
+
+    return sys.argv[1], int(sys.argv[2])
+
+
+def main():
+    '''Runner function to measure large value lookups and memory'''
+
+    args = get_cml_args()
+    if not args:
+        return 1
+
+    host, port = args
+    seconds = 3
+
+    client = HashTableClient.HashTableClient()
+    sock = client.connect_to_server(host, port)
+
+    values = [make_value(i) for i in range(KEYS)]
+    client.pipeline(sock, [{"method": "insert", "key": f"value-{i}", "value": value}
+            for i, value in enumerate(values)])
+
+    count = 0
+    start = time.time_ns()
+    while time.time_ns() - start < seconds * (10 ** 9):
+        client.pipeline(sock, [{"method": "lookup", "key": f"value-{(count + i) % KEYS}"}
+                for i in range(BATCH)])
+        count += BATCH
+
+    print("Performance of Lookup Operation:")
+    print(f"Value Size:            {len(json.dumps(values[0]))} bytes")
+    print(f"Bandwith (ops/sec):    {count / seconds:.0f} ops/second\n")
+
+    count = 0
+    start = time.time_ns()
+    while time.time_ns() - start < seconds * (10 ** 9):
+        client.scan("^value-1", sock)
+        count += 1
+
+    print("Performance of Scan Operation:")
+    print(f"Bandwith (ops/sec):    {count / seconds:.0f} ops/second\n")
+
+    stats = client.stats(sock)["result"]
+    decoded = sum(deep_size(value) for value in values)
+
+    print("Memory of Stored Values:")
+    print(f"Keys on Server:        {stats['keys']}")
+    print(f"Stored Encoded:        {stats['value_bytes']} bytes")
+    print(f"Decoded Objects:       {decoded} bytes (these {KEYS} values)")
+
+    sock.close()
+
+
+if __name__ == '__main__':
+    main()
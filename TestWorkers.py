@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+# TestWorkers.py
+# Author: Kristen Friday
+# Date: October 18, 2026
+
+# Measures total lookup throughput of one server from several client
+# processes; run it against servers started with different --workers
+# values to see how lookups scale with the number of worker processes
+
+import sys
+import os
+import time
+import HashTableClient
+
+
+KEYS = 10000
+BATCH = 100
+
+
+def load_keys(host, port):
+    '''Insert the keys that the lookups will read'''
+
+    client = HashTableClient.HashTableClient()
+    sock = client.connect_to_server(host, port)
+
+    messages = [{"method": "insert", "key": str(i), "value": str(i)} for i in range(KEYS)]
+    client.pipeline(sock, messages)
+    sock.close()
+
+
+def time_lookup(host, port, seconds):
+    '''Pipeline lookups for the given number of seconds; return the count'''
+
+    client = HashTableClient.HashTableClient()
+    sock = client.connect_to_server(host, port)
+
+    count = 0
+    start = time.time_ns()
+    while time.time_ns() - start < seconds * (10 ** 9):
+        messages = [{"method": "lookup", "key": str((count + i) % KEYS)}
+                for i in range(BATCH)]
+        client.pipeline(sock, messages)
+        count += BATCH
+
+    sock.close()
+
+    return count
+
+
+def get_cml_args():
+    '''Get host, port and number of client processes from command line'''
+
+    if (len(sys.argv) != 4):
+        print(f'Usage: ./TestWorkers.py [HOST] [PORT] [CLIENTS]')
+        return None
+
+    return sys.argv[1:]
+
+
+def main():
+    '''Runner function to measure lookup throughput from many clients'''
+
+    args = get_cml_args()
+    if not args:
+        return 1
+
+    host, port, clients = args
+    clients = int(clients)
+    seconds = 3
+
+    load_keys(host, port)
+
+    # each client process reports its count through a pipe
+    pipes = []
+    for _ in range(clients):
+        read_fd, write_fd = os.pipe()
+        if (os.fork() == 0):
+            os.close(read_fd)
+            count = time_lookup(host, port, seconds)
+            os.write(write_fd, str(count).encode('utf-8'))
+            os._exit(0)
+        os.close(write_fd)
+        pipes.append(read_fd)
+
+    total = 0
+    for read_fd in pipes:
+        total += int(os.read(read_fd, 64).decode('utf-8'))
+        os.close(read_fd)
+        os.wait()
+
+    print("Performance of Lookup Operation:")
+    print(f"Client Processes:      {clients}")
+    print(f"Total Operations:      {total} operations")
+    print(f"Bandwith (ops/sec):    {total / seconds:.0f} ops/second\n")
+
+
+if __name__ == '__main__':
+    main()